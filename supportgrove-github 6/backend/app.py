@@ -1,3 +1,4 @@
+import atexit
 import os
 import sys
 from dotenv import load_dotenv
@@ -16,6 +17,19 @@ from src.routes.categories import categories_bp
 from src.routes.comments import comments_bp
 from src.routes.notifications import notifications_bp
 from src.routes.sharing import sharing_bp
+from src.routes.cache import cache_bp
+from src.migrations import upgrade, pending_migrations, analyze, check_query_plans
+from src.services.category_stats import reconcile_category_story_counts
+from src.services.email_sender import send_queued_emails
+from src.services.hashtags import backfill_story_hashtags
+from src.services.notification_outbox import process_notification_outbox
+from src.services.notification_retention import prune_old_notifications
+from src.services.notification_stream import prune_notification_events
+from src.services.reaction_buffer import reaction_buffer, DEFAULT_JOURNAL_DIR
+from src.services.share_archive import archive_expired_shares
+from src.services.share_views import flush_share_views
+from src.services.scheduler import run_job, run_periodically
+from src.services.trending import rebuild_hashtag_counts
 
 def create_app():
     app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
@@ -40,10 +54,153 @@ def create_app():
     app.register_blueprint(comments_bp, url_prefix='/api')
     app.register_blueprint(notifications_bp, url_prefix='/api')
     app.register_blueprint(sharing_bp, url_prefix='/api')
+    app.register_blueprint(cache_bp, url_prefix='/api')
     
     # Create database tables
     with app.app_context():
         db.create_all()
+        # Deployments run 'flask db-upgrade' once before starting the workers
+        if os.environ.get('AUTO_MIGRATE', 'true').lower() != 'false':
+            upgrade(db.engine)
+    
+    # Background jobs
+    run_periodically(
+        app,
+        'reconcile-category-counts',
+        float(os.environ.get('CATEGORY_RECONCILE_INTERVAL', 3600)),
+        reconcile_category_story_counts
+    )
+    run_periodically(
+        app,
+        'rebuild-hashtag-counts',
+        float(os.environ.get('TRENDING_REBUILD_INTERVAL', 3600)),
+        rebuild_hashtag_counts
+    )
+    run_periodically(
+        app,
+        'process-notification-outbox',
+        float(os.environ.get('NOTIFICATION_OUTBOX_INTERVAL', 1)),
+        process_notification_outbox
+    )
+    run_periodically(
+        app,
+        'notification-retention',
+        float(os.environ.get('NOTIFICATION_RETENTION_INTERVAL', 3600)),
+        prune_old_notifications
+    )
+    run_periodically(
+        app,
+        'prune-notification-events',
+        float(os.environ.get('NOTIFICATION_EVENT_PRUNE_INTERVAL', 600)),
+        prune_notification_events
+    )
+    run_periodically(
+        app,
+        'archive-expired-shares',
+        float(os.environ.get('SHARE_ARCHIVE_INTERVAL', 3600)),
+        archive_expired_shares
+    )
+    run_periodically(
+        app,
+        'analyze-database',
+        float(os.environ.get('QUERY_STATS_INTERVAL', 3600)),
+        lambda: analyze(db.engine)
+    )
+    run_periodically(
+        app,
+        'send-emails',
+        float(os.environ.get('EMAIL_OUTBOX_INTERVAL', 5)),
+        send_queued_emails
+    )
+    
+    # Shared link views are counted in memory and written in batches
+    run_periodically(
+        app,
+        'flush-share-views',
+        float(os.environ.get('SHARE_VIEW_FLUSH_INTERVAL', 5)),
+        flush_share_views,
+        singleton=False
+    )
+    atexit.register(run_job, app, 'flush-share-views', flush_share_views, singleton=False)
+    
+    # Write-behind reactions: requests append to a journal, flushed in batches
+    if os.environ.get('REACTION_WRITE_BEHIND', 'false').lower() == 'true':
+        reaction_buffer.configure(
+            os.environ.get('REACTION_JOURNAL_DIR', DEFAULT_JOURNAL_DIR),
+            fsync=os.environ.get('REACTION_JOURNAL_FSYNC', 'false').lower() == 'true'
+        )
+        run_periodically(
+            app,
+            'flush-reactions',
+            float(os.environ.get('REACTION_FLUSH_INTERVAL_MS', 250)) / 1000,
+            reaction_buffer.flush,
+            singleton=False
+        )
+        atexit.register(run_job, app, 'flush-reactions', reaction_buffer.flush, singleton=False)
+    
+    @app.cli.command('reconcile-category-counts')
+    def reconcile_category_counts_command():
+        """Repair drifted category story counts"""
+        repaired = reconcile_category_story_counts()
+        print(f'Repaired {repaired} categories')
+    
+    @app.cli.command('process-notification-outbox')
+    def process_notification_outbox_command():
+        """Deliver queued notifications, e.g. when background jobs are disabled"""
+        delivered = process_notification_outbox()
+        print(f'Delivered {delivered} notifications')
+    
+    @app.cli.command('send-emails')
+    def send_emails_command():
+        """Send queued emails, e.g. when background jobs are disabled"""
+        sent = send_queued_emails()
+        print(f'Sent {sent} emails')
+    
+    @app.cli.command('prune-notifications')
+    def prune_notifications_command():
+        """Delete notifications past their retention period"""
+        deleted = prune_old_notifications()
+        for notification_type, count in deleted.items():
+            print(f'{notification_type}: removed {count}')
+        print(f'Removed {sum(deleted.values())} notifications')
+    
+    @app.cli.command('archive-expired-shares')
+    def archive_expired_shares_command():
+        """Move expired shared links to the archive table"""
+        archived = archive_expired_shares()
+        print(f'Archived {archived} shared links')
+    
+    @app.cli.command('backfill-hashtags')
+    def backfill_hashtags_command():
+        """Index hashtags of stories that are missing from story_hashtags"""
+        inserted = backfill_story_hashtags()
+        print(f'Indexed {inserted} story hashtags')
+    
+    @app.cli.command('db-upgrade')
+    def db_upgrade_command():
+        """Apply pending schema migrations"""
+        pending = pending_migrations(db.engine)
+        applied = upgrade(db.engine)
+        for version, description, _ in pending:
+            if version in applied:
+                print(f'Applied {version:04d}: {description}')
+        print(f'Database is up to date ({len(applied)} migrations applied)')
+    
+    @app.cli.command('analyze-db')
+    def analyze_db_command():
+        """Refresh query planner statistics now instead of waiting for the hourly job"""
+        analyze(db.engine)
+        print('Refreshed query planner statistics')
+    
+    @app.cli.command('check-indexes')
+    def check_indexes_command():
+        """Verify that every hot query is served by an index"""
+        failures = check_query_plans(db.engine)
+        for name, plan in failures:
+            print(f'{name}: ' + '; '.join(plan))
+        if failures:
+            raise SystemExit(1)
+        print('All hot queries use an index')
     
     # Health check endpoint
     @app.route('/health')
@@ -11,6 +11,7 @@ from src.routes.categories import categories_bp
 from src.routes.comments import comments_bp
 from src.routes.notifications import notifications_bp
 from src.routes.sharing import sharing_bp
+from src.routes.cache import cache_bp
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -23,6 +24,7 @@ app.register_blueprint(categories_bp, url_prefix='/api')
 app.register_blueprint(comments_bp, url_prefix='/api')
 app.register_blueprint(notifications_bp, url_prefix='/api')
 app.register_blueprint(sharing_bp, url_prefix='/api')
+app.register_blueprint(cache_bp, url_prefix='/api')
 
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
@@ -0,0 +1,4 @@
+# This file makes the migrations directory a Python package
+
+from src.migrations.runner import upgrade, pending_migrations, analyze
+from src.migrations.query_plans import check_query_plans
@@ -0,0 +1,146 @@
+"""EXPLAIN QUERY PLAN checks for the hot queries issued by the blueprints
+
+Each entry mirrors a query in ``src/routes`` with representative parameters.
+A plan that scans a whole table or sorts with a temporary B-tree means the
+query is missing a usable index.
+
+Plans are taken on an empty in-memory copy of the schema, without the
+``sqlite_stat1`` statistics, so the check depends on which indexes exist and
+not on how small the database currently is.
+"""
+from datetime import datetime
+from sqlalchemy import create_engine
+from src.models.story import db, Story, StoryHashtag, Response, Reaction
+from src.models.comment import Comment, CommentReaction, Notification
+from src.models.sharing import SharedConversation, ArchivedSharedConversation, StorySharingStats
+
+def _feed(order_column, category_id=None, seek=False):
+    query = db.select(Story).where(Story.is_approved == True, Story.is_flagged == False)
+    if category_id:
+        query = query.where(Story.category_id == category_id)
+    if seek:
+        query = query.where(db.tuple_(order_column, Story.id) < db.tuple_(0, 0))
+    return query.order_by(order_column.desc(), Story.id.desc()).limit(11)
+
+def hot_queries():
+    """Get (name, statement) pairs for the queries that must use an index"""
+    from src.routes.stories import reaction_state_query
+    
+    anonymous_id = '00000000-0000-0000-0000-000000000000'
+    queries = []
+    for column in (Story.created_at, Story.heart_count, Story.response_count):
+        queries += [
+            (f'stories feed by {column.key}', _feed(column)),
+            (f'stories feed by {column.key} in category', _feed(column, category_id=1)),
+            (f'stories feed by {column.key} after cursor', _feed(column, seek=True)),
+        ]
+    queries += [
+        ('hashtag stories page', db.select(Story).join(StoryHashtag, StoryHashtag.story_id == Story.id).where(
+            StoryHashtag.tag == 'hope', Story.is_approved == True, Story.is_flagged == False
+        ).order_by(StoryHashtag.created_at.desc(), StoryHashtag.story_id.desc()).limit(11)),
+        ('story responses', db.select(Response).where(
+            Response.story_id == 1, Response.is_approved == True, Response.is_flagged == False
+        ).order_by(Response.created_at.asc())),
+        ('story reaction lookup', db.select(Reaction).where(
+            Reaction.story_id == 1, Reaction.anonymous_id == anonymous_id, Reaction.reaction_type == 'heart'
+        )),
+        ('reaction state for a page', reaction_state_query(anonymous_id, [1, 2, 3], [1, 2, 3])),
+        ('story top-level comments', db.select(Comment).where(
+            Comment.story_id == 1, Comment.parent_comment_id == None, Comment.is_deleted == False
+        ).order_by(Comment.created_at.asc())),
+        ('comment replies', db.select(Comment).where(
+            Comment.parent_comment_id == 1
+        ).order_by(Comment.created_at.asc())),
+        ('comment reaction lookup', db.select(CommentReaction).where(
+            CommentReaction.comment_id == 1,
+            CommentReaction.anonymous_id == anonymous_id,
+            CommentReaction.reaction_type == 'heart'
+        )),
+        ('notifications page', db.select(Notification, Story.title).outerjoin(
+            Story, Story.id == Notification.story_id
+        ).where(
+            Notification.recipient_anonymous_id == anonymous_id
+        ).order_by(Notification.created_at.desc()).limit(20)),
+        ('unread notifications page', db.select(Notification, Story.title).outerjoin(
+            Story, Story.id == Notification.story_id
+        ).where(
+            Notification.recipient_anonymous_id == anonymous_id, Notification.is_read == False
+        ).order_by(Notification.created_at.desc()).limit(20)),
+        ('coalescable notification lookup', db.select(Notification.id).where(
+            Notification.recipient_anonymous_id == anonymous_id,
+            Notification.aggregate_key == 'comment_reaction:1',
+            Notification.is_read == False,
+            Notification.created_at >= datetime(2000, 1, 1)
+        ).order_by(Notification.created_at.desc()).limit(1)),
+        ('expired notifications batch', db.select(
+            Notification.id, Notification.recipient_anonymous_id, Notification.is_read
+        ).where(
+            Notification.type == 'comment_reaction', Notification.created_at < datetime(2000, 1, 1)
+        ).order_by(Notification.created_at.asc()).limit(500)),
+        ('shared conversation lookup', db.select(SharedConversation).where(
+            SharedConversation.share_id == 'x' * 16
+        )),
+        ('expired shared links batch', db.select(SharedConversation.id).where(
+            SharedConversation.expires_at < datetime(2000, 1, 1)
+        ).order_by(SharedConversation.expires_at.asc()).limit(500)),
+        ('share filter refresh', db.select(SharedConversation.id, SharedConversation.share_id).where(
+            SharedConversation.id > 1
+        ).order_by(SharedConversation.id.asc())),
+        ('archived shared conversation lookup', db.select(ArchivedSharedConversation).where(
+            ArchivedSharedConversation.share_id == 'x' * 16
+        )),
+        ('story sharing stats', db.select(StorySharingStats).where(
+            StorySharingStats.story_id.in_([1, 2, 3])
+        )),
+        ('view rollup update', StorySharingStats.__table__.update().where(
+            StorySharingStats.story_id == db.select(SharedConversation.story_id).where(
+                SharedConversation.id == 1
+            ).scalar_subquery()
+        ).values(total_views=StorySharingStats.total_views + 1)),
+    ]
+    return queries
+
+def explain(connection, statement):
+    """Get the EXPLAIN QUERY PLAN detail lines for a statement"""
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = [compiled.params[name] for name in compiled.positiontup]
+    params = [value.isoformat(' ') if isinstance(value, datetime) else value for value in params]
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', tuple(params))
+    return [row[-1] for row in rows]
+
+def _is_unindexed(detail):
+    if detail.startswith('SCAN ') and ' USING ' not in detail:
+        return True
+    return detail.startswith('USE TEMP B-TREE')
+
+def _schema(connection):
+    """Get the CREATE statements of the tables and indexes, leaving out statistics"""
+    # Shadow tables come back with their virtual table, sqlite_* tables are internal
+    tables = {
+        row[1] for row in connection.exec_driver_sql('PRAGMA main.table_list')
+        if row[2] in ('table', 'virtual') and not row[1].startswith('sqlite_')
+    }
+    rows = connection.exec_driver_sql(
+        "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE type IN ('table', 'index') AND sql IS NOT NULL "
+        "ORDER BY type = 'index', rowid"
+    )
+    return [sql for kind, name, table, sql in rows if (name if kind == 'table' else table) in tables]
+
+def check_query_plans(engine):
+    """Return a list of (name, plan) for hot queries that do not use an index"""
+    with engine.connect() as connection:
+        schema = _schema(connection)
+    
+    copy = create_engine('sqlite://')
+    failures = []
+    try:
+        with copy.connect() as connection:
+            for statement in schema:
+                connection.exec_driver_sql(statement)
+            for name, statement in hot_queries():
+                plan = explain(connection, statement)
+                if any(_is_unindexed(detail) for detail in plan):
+                    failures.append((name, plan))
+    finally:
+        copy.dispose()
+    return failures
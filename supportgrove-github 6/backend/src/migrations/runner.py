@@ -0,0 +1,67 @@
+import logging
+from datetime import datetime
+from src.migrations.versions import MIGRATIONS, refresh_statistics
+
+logger = logging.getLogger(__name__)
+
+CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description VARCHAR(200) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+"""
+
+def _begin_exclusive(connection):
+    """Start a transaction that holds the database write lock
+    
+    On SQLite this makes concurrent runners (e.g. several gunicorn workers
+    booting at once) queue up, so each migration is applied exactly once.
+    """
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+    else:
+        connection.begin()
+
+def applied_versions(connection):
+    """Get the set of migration versions already applied"""
+    connection.exec_driver_sql(CREATE_VERSION_TABLE)
+    return {row[0] for row in connection.exec_driver_sql('SELECT version FROM schema_migrations')}
+
+def pending_migrations(engine):
+    """List migrations that have not been applied yet"""
+    with engine.connect() as connection:
+        applied = applied_versions(connection)
+        connection.commit()
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+def upgrade(engine):
+    """Apply all pending migrations in order and return their versions"""
+    with engine.connect() as connection:
+        _begin_exclusive(connection)
+        try:
+            applied = applied_versions(connection)
+            newly_applied = []
+            for version, description, migrate in MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info('Applying migration %04d: %s', version, description)
+                migrate(connection)
+                connection.exec_driver_sql(
+                    'INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)',
+                    (version, description, datetime.utcnow().isoformat(' '))
+                )
+                newly_applied.append(version)
+            # New tables and indexes need statistics, or the planner keeps old plans
+            if newly_applied:
+                refresh_statistics(connection)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    return newly_applied
+
+def analyze(engine):
+    """Refresh planner statistics for the whole database as it grows"""
+    with engine.begin() as connection:
+        refresh_statistics(connection)
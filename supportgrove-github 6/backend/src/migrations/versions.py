@@ -0,0 +1,223 @@
+"""Versioned schema migrations
+
+``db.create_all()`` creates missing tables but never alters existing ones, so
+every schema change after the initial release is shipped here as well. Each
+migration must be idempotent against a database freshly created from the
+current models, because ``create_all()`` runs before the migrations do.
+"""
+from datetime import datetime, timedelta
+from src.services.trending import bucket_start, fill_hourly_counts
+
+ANALYSIS_LIMIT = 1000
+
+def _columns(connection, table):
+    return {row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info({table})')}
+
+def refresh_statistics(connection, *tables):
+    """Refresh the query planner statistics in sqlite_stat1
+    
+    ``analysis_limit`` bounds the rows ANALYZE reads per index, so this stays
+    cheap on large tables. ``PRAGMA optimize`` is not enough on its own: on
+    SQLite 3.40 it skips tables the connection has not queried, which leaves
+    statistics taken while the database was tiny in place for good.
+    """
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.exec_driver_sql(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    for table in tables or (None,):
+        connection.exec_driver_sql(f'ANALYZE {table}' if table else 'ANALYZE')
+
+def add_category_story_count(connection):
+    if 'story_count' not in _columns(connection, 'category'):
+        connection.exec_driver_sql('ALTER TABLE category ADD COLUMN story_count INTEGER NOT NULL DEFAULT 0')
+    connection.exec_driver_sql("""
+        UPDATE category SET story_count = (
+            SELECT COUNT(*) FROM story
+            WHERE story.category_id = category.id AND story.is_approved = 1 AND story.is_flagged = 0
+        )
+    """)
+
+HOT_PATH_INDEXES = [
+    ('ix_story_feed_created', 'story', 'is_approved, is_flagged, created_at, id'),
+    ('ix_story_feed_hearts', 'story', 'is_approved, is_flagged, heart_count, id'),
+    ('ix_story_feed_responses', 'story', 'is_approved, is_flagged, response_count, id'),
+    ('ix_story_category_feed_created', 'story', 'category_id, is_approved, is_flagged, created_at, id'),
+    ('ix_story_category_feed_hearts', 'story', 'category_id, is_approved, is_flagged, heart_count, id'),
+    ('ix_story_category_feed_responses', 'story', 'category_id, is_approved, is_flagged, response_count, id'),
+    ('ix_response_story', 'response', 'story_id, is_approved, is_flagged, created_at'),
+    ('ix_comments_story_thread', 'comments', 'story_id, parent_comment_id, is_deleted, created_at'),
+    ('ix_comments_parent', 'comments', 'parent_comment_id, created_at'),
+    ('ix_notifications_recipient_unread', 'notifications', 'recipient_anonymous_id, is_read, created_at'),
+    ('ix_notifications_recipient_created', 'notifications', 'recipient_anonymous_id, created_at'),
+    ('ix_notifications_created', 'notifications', 'created_at'),
+    ('ix_shared_conversations_story_id', 'shared_conversations', 'story_id'),
+    ('ix_forwarded_emails_story_id', 'forwarded_emails', 'story_id'),
+]
+
+def add_hot_path_indexes(connection):
+    for name, table, columns in HOT_PATH_INDEXES:
+        connection.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+    refresh_statistics(connection)
+
+def add_story_search_index(connection):
+    # External-content table: the text lives in ``story`` and triggers keep the
+    # index in step with inserts, edits and deletes. Moderation state is not
+    # indexed; searches join back to ``story`` and filter on it.
+    connection.exec_driver_sql("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS story_fts USING fts5(
+            title, content, healing_process, next_steps,
+            content='story', content_rowid='id',
+            tokenize='porter unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    """)
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS story_fts_insert AFTER INSERT ON story BEGIN
+            INSERT INTO story_fts (rowid, title, content, healing_process, next_steps)
+            VALUES (new.id, new.title, new.content, new.healing_process, new.next_steps);
+        END
+    """)
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS story_fts_delete AFTER DELETE ON story BEGIN
+            INSERT INTO story_fts (story_fts, rowid, title, content, healing_process, next_steps)
+            VALUES ('delete', old.id, old.title, old.content, old.healing_process, old.next_steps);
+        END
+    """)
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS story_fts_update
+        AFTER UPDATE OF title, content, healing_process, next_steps ON story BEGIN
+            INSERT INTO story_fts (story_fts, rowid, title, content, healing_process, next_steps)
+            VALUES ('delete', old.id, old.title, old.content, old.healing_process, old.next_steps);
+            INSERT INTO story_fts (rowid, title, content, healing_process, next_steps)
+            VALUES (new.id, new.title, new.content, new.healing_process, new.next_steps);
+        END
+    """)
+    # Title matches weigh most, then the guided answers, then the story body
+    connection.exec_driver_sql("INSERT INTO story_fts (story_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 2.0, 2.0)')")
+    connection.exec_driver_sql("INSERT INTO story_fts (story_fts) VALUES ('rebuild')")
+
+def backfill_story_hashtags(connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS story_hashtags (
+            tag VARCHAR(50) NOT NULL,
+            story_id INTEGER NOT NULL REFERENCES story (id),
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY (tag, story_id)
+        )
+    """)
+    connection.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_story_hashtags_tag_created ON story_hashtags (tag, created_at, story_id)')
+    connection.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_story_hashtags_story ON story_hashtags (story_id)')
+    connection.exec_driver_sql("""
+        INSERT OR IGNORE INTO story_hashtags (tag, story_id, created_at)
+        SELECT DISTINCT json_each.value, story.id, story.created_at
+        FROM story, json_each(story.hashtags)
+        WHERE json_valid(story.hashtags) AND json_each.type = 'text'
+    """)
+    # Without statistics for the new index the hashtag page scans story instead
+    refresh_statistics(connection, 'story_hashtags', 'story')
+
+def backfill_hashtag_hourly_counts(connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS hashtag_hourly_counts (
+            bucket_start DATETIME NOT NULL,
+            tag VARCHAR(50) NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (bucket_start, tag)
+        )
+    """)
+    fill_hourly_counts(connection, bucket_start(datetime.utcnow() - timedelta(days=30)))
+
+def add_comment_reply_count(connection):
+    if 'reply_count' not in _columns(connection, 'comments'):
+        connection.exec_driver_sql('ALTER TABLE comments ADD COLUMN reply_count INTEGER NOT NULL DEFAULT 0')
+    connection.exec_driver_sql("""
+        UPDATE comments SET reply_count = (
+            SELECT COUNT(*) FROM comments AS replies
+            WHERE replies.parent_comment_id = comments.id AND replies.is_deleted = 0
+        )
+    """)
+
+def backfill_notification_counters(connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS notification_counters (
+            recipient_anonymous_id VARCHAR(100) NOT NULL PRIMARY KEY,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            total_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    connection.exec_driver_sql("""
+        INSERT OR REPLACE INTO notification_counters (recipient_anonymous_id, unread_count, total_count)
+        SELECT recipient_anonymous_id, SUM(CASE WHEN is_read = 0 THEN 1 ELSE 0 END), COUNT(*)
+        FROM notifications
+        GROUP BY recipient_anonymous_id
+    """)
+
+def add_notification_source_key(connection):
+    if 'source_key' not in _columns(connection, 'notifications'):
+        connection.exec_driver_sql('ALTER TABLE notifications ADD COLUMN source_key VARCHAR(100)')
+    connection.exec_driver_sql(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_notifications_source_key ON notifications (source_key)'
+    )
+
+def add_notification_coalescing(connection):
+    columns = _columns(connection, 'notifications')
+    if 'aggregate_key' not in columns:
+        connection.exec_driver_sql('ALTER TABLE notifications ADD COLUMN aggregate_key VARCHAR(100)')
+    if 'actor_count' not in columns:
+        connection.exec_driver_sql('ALTER TABLE notifications ADD COLUMN actor_count INTEGER NOT NULL DEFAULT 1')
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_notifications_aggregate '
+        'ON notifications (recipient_anonymous_id, aggregate_key, is_read, created_at)'
+    )
+
+def add_notification_retention_index(connection):
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_notifications_type_created ON notifications (type, created_at)'
+    )
+
+def add_story_conversation_version(connection):
+    if 'conversation_version' not in _columns(connection, 'story'):
+        connection.exec_driver_sql('ALTER TABLE story ADD COLUMN conversation_version INTEGER NOT NULL DEFAULT 0')
+
+def backfill_story_sharing_stats(connection):
+    connection.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS story_sharing_stats (
+            story_id INTEGER NOT NULL PRIMARY KEY REFERENCES story (id),
+            share_count INTEGER NOT NULL DEFAULT 0,
+            email_forwards INTEGER NOT NULL DEFAULT 0,
+            total_views INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    connection.exec_driver_sql("""
+        INSERT OR REPLACE INTO story_sharing_stats (story_id, share_count, email_forwards, total_views)
+        SELECT story.id,
+               (SELECT COUNT(*) FROM shared_conversations WHERE story_id = story.id),
+               (SELECT COUNT(*) FROM forwarded_emails WHERE story_id = story.id),
+               (SELECT COALESCE(SUM(view_count), 0) FROM shared_conversations WHERE story_id = story.id)
+        FROM story
+        WHERE story.id IN (SELECT story_id FROM shared_conversations UNION SELECT story_id FROM forwarded_emails)
+    """)
+
+def add_shared_conversation_expiry_index(connection):
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_shared_conversations_expires_at ON shared_conversations (expires_at)'
+    )
+    # Stats gathered before the index existed make the expiry batch and share filter refresh sort
+    refresh_statistics(connection, 'shared_conversations')
+
+# (version, description, function taking a connection)
+MIGRATIONS = [
+    (1, 'Add category.story_count', add_category_story_count),
+    (2, 'Add composite indexes for feed, comment and notification queries', add_hot_path_indexes),
+    (3, 'Add FTS5 full-text index for story search', add_story_search_index),
+    (4, 'Add story_hashtags index table', backfill_story_hashtags),
+    (5, 'Add hourly hashtag counters for trending', backfill_hashtag_hourly_counts),
+    (6, 'Add comments.reply_count', add_comment_reply_count),
+    (7, 'Add per-recipient notification counters', backfill_notification_counters),
+    (8, 'Add notifications.source_key for outbox deliveries', add_notification_source_key),
+    (9, 'Add notification coalescing columns', add_notification_coalescing),
+    (10, 'Add notification retention index', add_notification_retention_index),
+    (11, 'Add story.conversation_version', add_story_conversation_version),
+    (12, 'Add per-story sharing stats rollup', backfill_story_sharing_stats),
+    (13, 'Add shared link expiry index for archiving', add_shared_conversation_expiry_index),
+]
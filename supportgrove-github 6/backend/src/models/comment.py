@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from src.models.story import db
 
 class Comment(db.Model):
@@ -14,12 +15,33 @@ class Comment(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
     
+    # Non-deleted direct replies (maintained by create_reply and delete_comment)
+    reply_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    
     # Relationships
     story = db.relationship('Story', backref='comments')
     parent_comment = db.relationship('Comment', remote_side=[id], backref='replies')
     reactions = db.relationship('CommentReaction', backref='comment', cascade='all, delete-orphan')
     
-    def to_dict(self):
+    __table_args__ = (
+        db.Index('ix_comments_story_thread', 'story_id', 'parent_comment_id', 'is_deleted', 'created_at'),
+        db.Index('ix_comments_parent', 'parent_comment_id', 'created_at'),
+    )
+    
+    def to_dict(self, children=None, reaction_counts=None):
+        """Serialize the comment with its non-deleted replies
+        
+        ``children`` (parent ID -> replies) and ``reaction_counts`` (comment
+        ID -> counts) come from build_comment_tree; without them the replies
+        and reactions are lazy-loaded per comment.
+        """
+        if children is None:
+            replies = [r for r in self.replies if not r.is_deleted]
+            counts = self.get_reaction_counts()
+        else:
+            replies = [r for r in children.get(self.id, []) if not r.is_deleted]
+            counts = reaction_counts.get(self.id) or empty_reaction_counts()
+        
         return {
             'id': self.id,
             'story_id': self.story_id,
@@ -30,19 +52,73 @@ class Comment(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'is_deleted': self.is_deleted,
-            'reply_count': len([r for r in self.replies if not r.is_deleted]),
-            'reaction_counts': self.get_reaction_counts(),
-            'replies': [reply.to_dict() for reply in self.replies if not reply.is_deleted]
+            'reply_count': len(replies),
+            'reaction_counts': counts,
+            'replies': [reply.to_dict(children, reaction_counts) for reply in replies]
         }
     
     def get_reaction_counts(self):
         """Get count of each reaction type for this comment"""
-        reaction_counts = {'heart': 0, 'hug': 0, 'strength': 0}
+        reaction_counts = empty_reaction_counts()
         for reaction in self.reactions:
             if reaction.reaction_type in reaction_counts:
                 reaction_counts[reaction.reaction_type] += 1
         return reaction_counts
 
+def empty_reaction_counts():
+    return {'heart': 0, 'hug': 0, 'strength': 0}
+
+def _reaction_counts_by_comment(query):
+    rows = query.group_by(CommentReaction.comment_id, CommentReaction.reaction_type).all()
+    reaction_counts = {}
+    for comment_id, reaction_type, count in rows:
+        counts = reaction_counts.setdefault(comment_id, empty_reaction_counts())
+        if reaction_type in counts:
+            counts[reaction_type] = count
+    return reaction_counts
+
+def _reaction_counts_query():
+    return db.session.query(
+        CommentReaction.comment_id,
+        CommentReaction.reaction_type,
+        db.func.count(CommentReaction.id)
+    )
+
+def get_story_reaction_counts(story_id):
+    """Get reaction counts for every comment of a story in one aggregate query"""
+    return _reaction_counts_by_comment(
+        _reaction_counts_query()
+        .join(Comment, Comment.id == CommentReaction.comment_id)
+        .filter(Comment.story_id == story_id)
+    )
+
+def get_reaction_counts_for(comment_ids):
+    """Get reaction counts for a set of comments in one aggregate query"""
+    if not comment_ids:
+        return {}
+    return _reaction_counts_by_comment(
+        _reaction_counts_query().filter(CommentReaction.comment_id.in_(comment_ids))
+    )
+
+def build_comment_tree(story_id):
+    """Serialize a story's comment threads using two queries
+    
+    All comments of the story are fetched at once and linked through an
+    adjacency map instead of lazy-loading replies and reactions per comment.
+    The output matches Comment.to_dict for each top-level comment.
+    """
+    comments = Comment.query.filter_by(story_id=story_id).order_by(
+        Comment.created_at.asc(), Comment.id.asc()
+    ).all()
+    reaction_counts = get_story_reaction_counts(story_id)
+    
+    children = {}
+    for comment in comments:
+        children.setdefault(comment.parent_comment_id, []).append(comment)
+    
+    return [comment.to_dict(children, reaction_counts) for comment in children.get(None, [])
+            if not comment.is_deleted]
+
 class CommentReaction(db.Model):
     __tablename__ = 'comment_reactions'
     
@@ -76,12 +152,34 @@ class Notification(db.Model):
     message = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    source_key = db.Column(db.String(100), nullable=True)  # Makes outbox deliveries idempotent
+    aggregate_key = db.Column(db.String(100), nullable=True)  # Activity on the same target merges into one row
+    actor_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Relationships
     story = db.relationship('Story', backref='notifications')
     comment = db.relationship('Comment', backref='notifications')
     
-    def to_dict(self):
+    __table_args__ = (
+        db.Index('ix_notifications_recipient_unread', 'recipient_anonymous_id', 'is_read', 'created_at'),
+        db.Index('ix_notifications_recipient_created', 'recipient_anonymous_id', 'created_at'),
+        db.Index('ix_notifications_created', 'created_at'),
+        db.Index('ix_notifications_type_created', 'type', 'created_at'),
+        db.Index('ix_notifications_source_key', 'source_key', unique=True),
+        db.Index('ix_notifications_aggregate', 'recipient_anonymous_id', 'aggregate_key', 'is_read', 'created_at'),
+    )
+    
+    def to_dict(self, story_titles=None):
+        """Serialize the notification
+        
+        ``story_titles`` maps story IDs to titles; when given, the story
+        relationship (and its content) is never loaded.
+        """
+        if story_titles is not None:
+            story_title = story_titles.get(self.story_id)
+        else:
+            story_title = self.story.title if self.story else None
+        
         return {
             'id': self.id,
             'recipient_anonymous_id': self.recipient_anonymous_id,
@@ -92,6 +190,87 @@ class Notification(db.Model):
             'message': self.message,
             'is_read': self.is_read,
             'created_at': self.created_at.isoformat(),
-            'story_title': self.story.title if self.story else None
+            'actor_count': self.actor_count or 1,
+            'story_title': story_title
         }
 
+def get_story_titles(story_ids):
+    """Get story titles by ID, selecting only the id and title columns"""
+    from src.models.story import Story
+    
+    story_ids = {story_id for story_id in story_ids if story_id is not None}
+    if not story_ids:
+        return {}
+    return dict(db.session.query(Story.id, Story.title).filter(Story.id.in_(story_ids)).all())
+
+class NotificationActor(db.Model):
+    """Distinct people behind a coalesced notification"""
+    __tablename__ = 'notification_actors'
+    
+    notification_id = db.Column(db.Integer, db.ForeignKey('notifications.id'), primary_key=True)
+    anonymous_id = db.Column(db.String(100), primary_key=True)
+
+class NotificationOutbox(db.Model):
+    """Notification work queued by requests and processed by a background job"""
+    __tablename__ = 'notification_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)  # Notification type to create
+    payload = db.Column(db.Text, nullable=False)  # JSON with the IDs the job needs
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Outbox IDs end up in notification source keys, so they must never be reused
+    __table_args__ = ({'sqlite_autoincrement': True},)
+
+class NotificationCounter(db.Model):
+    """Per-recipient notification counts, kept in step with every notification change"""
+    __tablename__ = 'notification_counters'
+    
+    recipient_anonymous_id = db.Column(db.String(100), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    @staticmethod
+    def adjust(recipient_id, unread_delta=0, total_delta=0):
+        """Atomically add to a recipient's counts in SQL, creating the row on first use"""
+        statement = sqlite_insert(NotificationCounter).values(
+            recipient_anonymous_id=recipient_id,
+            unread_count=max(unread_delta, 0),
+            total_count=max(total_delta, 0)
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['recipient_anonymous_id'],
+            set_={
+                'unread_count': db.func.max(NotificationCounter.unread_count + unread_delta, 0),
+                'total_count': db.func.max(NotificationCounter.total_count + total_delta, 0)
+            }
+        ))
+    
+    @staticmethod
+    def get_counts(recipient_id):
+        """Get (unread_count, total_count) for a recipient with a primary-key lookup"""
+        row = db.session.execute(
+            db.select(NotificationCounter.unread_count, NotificationCounter.total_count)
+            .where(NotificationCounter.recipient_anonymous_id == recipient_id)
+        ).first()
+        return (row.unread_count, row.total_count) if row else (0, 0)
+
+class NotificationEvent(db.Model):
+    """Change feed of notifications, read by the notification streams of every worker"""
+    __tablename__ = 'notification_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipient_anonymous_id = db.Column(db.String(100), nullable=False)
+    event_type = db.Column(db.String(20), nullable=False)  # 'notification', 'read', 'deleted'
+    notification_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # AUTOINCREMENT keeps event IDs increasing after old events are pruned,
+    # since clients resume streams from the last ID they saw
+    __table_args__ = (
+        db.Index('ix_notification_events_recipient', 'recipient_anonymous_id', 'id'),
+        db.Index('ix_notification_events_created', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
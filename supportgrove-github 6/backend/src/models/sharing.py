@@ -1,18 +1,19 @@
 from datetime import datetime, timedelta
 import secrets
 import string
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from src.models.story import db
 
 class SharedConversation(db.Model):
     __tablename__ = 'shared_conversations'
     
     id = db.Column(db.Integer, primary_key=True)
-    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False, index=True)
     share_id = db.Column(db.String(32), unique=True, nullable=False)
     shared_by = db.Column(db.String(100))  # Optional sharer name
     personal_message = db.Column(db.Text)  # Optional message from sharer
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    expires_at = db.Column(db.DateTime)  # Optional expiration
+    expires_at = db.Column(db.DateTime, index=True)  # Optional expiration
     view_count = db.Column(db.Integer, default=0)
     
     # Relationship to story
@@ -29,12 +30,33 @@ class SharedConversation(db.Model):
     @staticmethod
     def generate_share_id():
         """Generate a unique, URL-safe share ID"""
-        while True:
-            # Generate a random 16-character string
-            share_id = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(16))
-            # Check if it's unique
-            if not SharedConversation.query.filter_by(share_id=share_id).first():
-                return share_id
+        return SharedConversation.generate_share_ids(1)[0]
+    
+    @staticmethod
+    def generate_share_ids(count):
+        """Generate ``count`` unique, URL-safe share IDs
+        
+        Only candidates the share ID filter may already contain are checked in
+        the database, so usually no query is needed at all.
+        """
+        from src.services.share_filter import share_id_filter
+        share_ids = set()
+        while len(share_ids) < count:
+            # Generate random 16-character strings
+            candidates = {
+                ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(16))
+                for _ in range(count - len(share_ids))
+            } - share_ids
+            # Drop any that are already taken, including by archived links
+            maybe_taken = [share_id for share_id in candidates if share_id_filter.might_contain(share_id, refresh=False)]
+            if maybe_taken:
+                taken = db.session.execute(db.union(
+                    db.select(SharedConversation.share_id).where(SharedConversation.share_id.in_(maybe_taken)),
+                    db.select(ArchivedSharedConversation.share_id).where(ArchivedSharedConversation.share_id.in_(maybe_taken))
+                )).scalars().all()
+                candidates -= set(taken)
+            share_ids |= candidates
+        return list(share_ids)
     
     def is_expired(self):
         """Check if the shared conversation has expired"""
@@ -43,9 +65,15 @@ class SharedConversation(db.Model):
         return False
     
     def increment_view_count(self):
-        """Increment the view count when someone accesses the shared conversation"""
-        self.view_count += 1
-        db.session.commit()
+        """Count a view; views are buffered and written to the database in batches"""
+        from src.services.share_views import record_share_view
+        record_share_view(self.id)
+    
+    @property
+    def current_view_count(self):
+        """Stored view count plus this worker's views not yet written"""
+        from src.services.share_views import pending_share_views
+        return (self.view_count or 0) + pending_share_views(self.id)
     
     def to_dict(self):
         return {
@@ -56,20 +84,34 @@ class SharedConversation(db.Model):
             'personal_message': self.personal_message,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'expires_at': self.expires_at.isoformat() if self.expires_at else None,
-            'view_count': self.view_count,
+            'view_count': self.current_view_count,
             'is_expired': self.is_expired()
         }
 
+class ArchivedSharedConversation(db.Model):
+    """Expired shared links moved out of ``shared_conversations`` by the archive job"""
+    __tablename__ = 'archived_shared_conversations'
+    
+    id = db.Column(db.Integer, primary_key=True)  # ID the link had in shared_conversations
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
+    share_id = db.Column(db.String(32), unique=True, nullable=False)
+    shared_by = db.Column(db.String(100))
+    personal_message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+    view_count = db.Column(db.Integer, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class ForwardedEmail(db.Model):
     __tablename__ = 'forwarded_emails'
     
     id = db.Column(db.Integer, primary_key=True)
-    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False, index=True)
     recipient_email = db.Column(db.String(255), nullable=False)
     sender_name = db.Column(db.String(100))
     personal_message = db.Column(db.Text)
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='sent')
+    status = db.Column(db.String(20), default='queued')  # 'queued', 'sent', 'failed'
     
     # Relationship to story
     story = db.relationship('Story', backref='forwarded_emails')
@@ -91,3 +133,71 @@ class ForwardedEmail(db.Model):
             'status': self.status
         }
 
+class EmailOutbox(db.Model):
+    """Rendered emails waiting for the background sender"""
+    __tablename__ = 'email_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    forwarded_email_id = db.Column(db.Integer, db.ForeignKey('forwarded_emails.id'), nullable=True, index=True)
+    recipient_email = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html_content = db.Column(db.Text, nullable=False)
+    text_content = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'sent', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    forwarded_email = db.relationship('ForwardedEmail', backref='outbox_entries')
+    
+    __table_args__ = (
+        db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+class StorySharingStats(db.Model):
+    """Per-story sharing totals, kept in step as links are created, forwarded and viewed"""
+    __tablename__ = 'story_sharing_stats'
+    
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), primary_key=True)
+    share_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    email_forwards = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_views = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    @staticmethod
+    def adjust(story_id, shares=0, forwards=0, views=0):
+        """Atomically add to a story's totals in SQL, creating the row on first use"""
+        statement = sqlite_insert(StorySharingStats).values(
+            story_id=story_id,
+            share_count=shares,
+            email_forwards=forwards,
+            total_views=views
+        )
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['story_id'],
+            set_={
+                'share_count': StorySharingStats.share_count + shares,
+                'email_forwards': StorySharingStats.email_forwards + forwards,
+                'total_views': StorySharingStats.total_views + views
+            }
+        ))
+    
+    @staticmethod
+    def get_many(story_ids):
+        """Get stats dicts for several stories with one primary-key lookup"""
+        rows = StorySharingStats.query.filter(StorySharingStats.story_id.in_(story_ids)).all()
+        stats = {row.story_id: row.to_dict() for row in rows}
+        return {story_id: stats.get(story_id, StorySharingStats.empty_dict()) for story_id in story_ids}
+    
+    @staticmethod
+    def empty_dict():
+        return {'share_count': 0, 'email_forwards': 0, 'total_views': 0, 'total_forwards': 0}
+    
+    def to_dict(self):
+        return {
+            'share_count': self.share_count,
+            'email_forwards': self.email_forwards,
+            'total_views': self.total_views,
+            'total_forwards': self.share_count + self.email_forwards
+        }
@@ -12,6 +12,9 @@ class Category(db.Model):
     icon = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Approved, unflagged stories in this category (maintained on story changes)
+    story_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    
     # Relationship
     stories = db.relationship('Story', backref='category', lazy=True)
     
@@ -25,7 +28,7 @@ class Category(db.Model):
             'description': self.description,
             'color': self.color,
             'icon': self.icon,
-            'story_count': len(self.stories)
+            'story_count': self.story_count or 0
         }
 
 class Story(db.Model):
@@ -55,6 +58,9 @@ class Story(db.Model):
     strength_count = db.Column(db.Integer, default=0)
     response_count = db.Column(db.Integer, default=0)
     
+    # Bumped whenever the story's conversation changes; keys cached snapshots
+    conversation_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    
     # Moderation
     is_approved = db.Column(db.Boolean, default=True)
     is_flagged = db.Column(db.Boolean, default=False)
@@ -67,17 +73,77 @@ class Story(db.Model):
     # Relationships
     responses = db.relationship('Response', backref='story', lazy=True, cascade='all, delete-orphan')
     reactions = db.relationship('Reaction', backref='story', lazy=True, cascade='all, delete-orphan')
+    hashtag_entries = db.relationship('StoryHashtag', lazy=True, cascade='all, delete-orphan')
+    
+    # Feed indexes: moderation filter, optional category, then each sort order
+    __table_args__ = (
+        db.Index('ix_story_feed_created', 'is_approved', 'is_flagged', 'created_at', 'id'),
+        db.Index('ix_story_feed_hearts', 'is_approved', 'is_flagged', 'heart_count', 'id'),
+        db.Index('ix_story_feed_responses', 'is_approved', 'is_flagged', 'response_count', 'id'),
+        db.Index('ix_story_category_feed_created', 'category_id', 'is_approved', 'is_flagged', 'created_at', 'id'),
+        db.Index('ix_story_category_feed_hearts', 'category_id', 'is_approved', 'is_flagged', 'heart_count', 'id'),
+        db.Index('ix_story_category_feed_responses', 'category_id', 'is_approved', 'is_flagged', 'response_count', 'id'),
+    )
+    
+    # Story column holding the counter for each reaction type
+    REACTION_COUNTERS = {
+        'heart': 'heart_count',
+        'hug': 'hug_count',
+        'strength': 'strength_count'
+    }
     
     def __repr__(self):
         return f'<Story {self.title[:50]}...>'
     
+    @staticmethod
+    def adjust_counter(story_id, counter, delta, listed_only=False):
+        """Atomically add ``delta`` to an engagement counter in SQL
+        
+        Runs ``UPDATE ... SET counter = counter + delta RETURNING ...`` so
+        concurrent workers never overwrite each other's increments. Counters
+        never go below zero. Returns the fresh engagement counts, or None if
+        the story does not exist (or is not listed, with ``listed_only``).
+        The conversation version is bumped too, as shared conversation
+        snapshots include these counts.
+        """
+        column = getattr(Story, counter)
+        value = column + delta if delta >= 0 else db.func.max(column + delta, 0)
+        statement = db.update(Story).where(Story.id == story_id)
+        if listed_only:
+            statement = statement.where(Story.is_approved == True, Story.is_flagged == False)
+        row = db.session.execute(
+            statement.values({counter: value, 'conversation_version': Story.conversation_version + 1})
+            .returning(Story.heart_count, Story.hug_count, Story.strength_count, Story.response_count)
+            .execution_options(synchronize_session=False)
+        ).first()
+        
+        if row is None:
+            return None
+        return {
+            'heart_count': row.heart_count,
+            'hug_count': row.hug_count,
+            'strength_count': row.strength_count,
+            'response_count': row.response_count
+        }
+    
+    @staticmethod
+    def bump_conversation_version(*story_ids):
+        """Invalidate cached conversation snapshots of the given stories"""
+        if story_ids:
+            db.session.execute(
+                db.update(Story).where(Story.id.in_(story_ids))
+                .values(conversation_version=Story.conversation_version + 1)
+                .execution_options(synchronize_session=False)
+            )
+    
     def to_dict(self, include_content=True):
         import json
+        from src.services.category_cache import get_category_dict
         data = {
             'id': self.id,
             'title': self.title,
             'pseudonym': self.pseudonym or 'Anonymous',
-            'category': self.category.to_dict() if self.category else None,
+            'category': get_category_dict(self.category_id),
             'hashtags': json.loads(self.hashtags) if self.hashtags else [],
             'trigger_warning': self.trigger_warning,
             'trigger_tags': self.trigger_tags,
@@ -119,6 +185,10 @@ class Response(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_response_story', 'story_id', 'is_approved', 'is_flagged', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Response to Story {self.story_id}>'
     
@@ -133,6 +203,33 @@ class Response(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
 
+class StoryHashtag(db.Model):
+    """Index row linking a hashtag to a story, mirroring Story.hashtags"""
+    __tablename__ = 'story_hashtags'
+    
+    tag = db.Column(db.String(50), primary_key=True)
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)  # Copy of Story.created_at for ordering
+    
+    __table_args__ = (
+        db.Index('ix_story_hashtags_tag_created', 'tag', 'created_at', 'story_id'),
+        db.Index('ix_story_hashtags_story', 'story_id'),
+    )
+    
+    def __repr__(self):
+        return f'<StoryHashtag #{self.tag} on Story {self.story_id}>'
+
+class HashtagHourlyCount(db.Model):
+    """Number of approved stories using a hashtag within one hour"""
+    __tablename__ = 'hashtag_hourly_counts'
+    
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    tag = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<HashtagHourlyCount #{self.tag} {self.bucket_start}: {self.count}>'
+
 class Reaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
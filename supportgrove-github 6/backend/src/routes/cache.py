@@ -0,0 +1,20 @@
+from flask import Blueprint, jsonify
+from src.services.response_cache import response_cache
+import os
+
+cache_bp = Blueprint('cache', __name__)
+
+@cache_bp.route('/cache/metrics', methods=['GET'])
+def get_cache_metrics():
+    """Get response cache hit/miss counters for the worker serving the request"""
+    try:
+        return jsonify({
+            'success': True,
+            'pid': os.getpid(),
+            **response_cache.metrics()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
@@ -1,9 +1,12 @@
 from flask import Blueprint, jsonify, request
 from src.models.story import db, Category
+from src.services.category_cache import invalidate_category_snapshot
+from src.services.response_cache import cached, invalidate_cache
 
 categories_bp = Blueprint('categories', __name__)
 
 @categories_bp.route('/categories', methods=['GET'])
+@cached('categories', ttl=300, tags=['categories'])
 def get_categories():
     """Get all categories with story counts"""
     try:
@@ -47,6 +50,8 @@ def create_category():
         
         db.session.add(category)
         db.session.commit()
+        invalidate_category_snapshot()
+        invalidate_cache('categories')
         
         return jsonify({
             'success': True,
@@ -61,6 +66,7 @@ def create_category():
         }), 500
 
 @categories_bp.route('/categories/<int:category_id>', methods=['GET'])
+@cached('category', ttl=300, tags=['categories'])
 def get_category(category_id):
     """Get a specific category"""
     try:
@@ -128,6 +134,8 @@ def seed_categories():
                 created_categories.append(cat_data['name'])
         
         db.session.commit()
+        invalidate_category_snapshot()
+        invalidate_cache('categories')
         
         return jsonify({
             'success': True,
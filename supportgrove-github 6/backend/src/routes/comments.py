@@ -1,7 +1,17 @@
 from flask import Blueprint, request, jsonify
 from src.models.story import db
 from src.models.story import Story
-from src.models.comment import Comment, CommentReaction, Notification
+from src.models.comment import (
+    Comment,
+    CommentReaction,
+    build_comment_tree,
+    empty_reaction_counts,
+    get_reaction_counts_for
+)
+from src.services.comment_threads import get_thread_page, thread_page_args
+from src.services.notification_outbox import enqueue_notification, notify_comment_reaction
+from src.services.reaction_buffer import ADD, COMMENT, reaction_buffer
+from src.services.response_cache import cached, invalidate_cache
 import uuid
 from datetime import datetime
 
@@ -14,43 +24,70 @@ def get_anonymous_id():
         anonymous_id = str(uuid.uuid4())
     return anonymous_id
 
-def create_notification(recipient_id, notification_type, story_id=None, comment_id=None, trigger_id=None, message=None):
-    """Create a notification for a user"""
-    # Don't create self-notifications
-    if recipient_id == trigger_id:
-        return
-    
-    notification = Notification(
-        recipient_anonymous_id=recipient_id,
-        type=notification_type,
-        story_id=story_id,
-        comment_id=comment_id,
-        trigger_anonymous_id=trigger_id,
-        message=message
-    )
-    db.session.add(notification)
-
 @comments_bp.route('/stories/<int:story_id>/comments', methods=['GET'])
+@cached('story_comments', ttl=30, tags=lambda story_id: [f'comments:{story_id}'])
 def get_story_comments(story_id):
     """Get all comments for a story"""
     try:
         story = Story.query.get_or_404(story_id)
         
-        # Get top-level comments (no parent)
-        comments = Comment.query.filter_by(
-            story_id=story_id, 
-            parent_comment_id=None,
-            is_deleted=False
-        ).order_by(Comment.created_at.asc()).all()
+        # Paginated, depth-limited threads when any paging parameter is given
+        if any(arg in request.args for arg in ('cursor', 'limit', 'max_depth')):
+            query = Comment.query.filter_by(
+                story_id=story_id,
+                parent_comment_id=None,
+                is_deleted=False
+            )
+            try:
+                page_args = thread_page_args(request.args)
+                comments, next_cursor = get_thread_page(query, **page_args)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            
+            return jsonify({
+                'success': True,
+                'comments': comments,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            })
+        
+        # Get top-level comments (no parent) with their reply trees
+        comments = build_comment_tree(story_id)
         
         return jsonify({
             'success': True,
-            'comments': [comment.to_dict() for comment in comments],
+            'comments': comments,
             'total_count': len(comments)
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@comments_bp.route('/comments/<int:comment_id>/replies', methods=['GET'])
+def get_comment_replies(comment_id):
+    """Load more replies of a comment, continuing from a replies_cursor"""
+    try:
+        parent_comment = Comment.query.get_or_404(comment_id)
+        
+        query = Comment.query.filter_by(
+            parent_comment_id=comment_id,
+            is_deleted=False
+        )
+        try:
+            page_args = thread_page_args(request.args)
+            replies, next_cursor = get_thread_page(query, **page_args)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'replies': replies,
+            'reply_count': parent_comment.reply_count,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @comments_bp.route('/stories/<int:story_id>/comments', methods=['POST'])
 def create_comment(story_id):
     """Create a new comment on a story"""
@@ -74,21 +111,15 @@ def create_comment(story_id):
         )
         
         db.session.add(comment)
+        Story.bump_conversation_version(story_id)
         db.session.flush()  # Get the comment ID
         
-        # Create notification for story author
+        # Queue notification for story author
         if story.anonymous_id != anonymous_id:
-            message = f"Someone commented on your story '{story.title}'"
-            create_notification(
-                recipient_id=story.anonymous_id,
-                notification_type='story_comment',
-                story_id=story_id,
-                comment_id=comment.id,
-                trigger_id=anonymous_id,
-                message=message
-            )
+            enqueue_notification('story_comment', comment_id=comment.id)
         
         db.session.commit()
+        invalidate_cache(f'comments:{story_id}')
         
         return jsonify({
             'success': True,
@@ -124,22 +155,16 @@ def create_reply(comment_id):
         )
         
         db.session.add(reply)
+        parent_comment.reply_count = Comment.reply_count + 1
+        Story.bump_conversation_version(parent_comment.story_id)
         db.session.flush()  # Get the reply ID
         
-        # Create notification for parent comment author
+        # Queue notification for parent comment author
         if parent_comment.anonymous_id != anonymous_id:
-            story = Story.query.get(parent_comment.story_id)
-            message = f"Someone replied to your comment on '{story.title}'"
-            create_notification(
-                recipient_id=parent_comment.anonymous_id,
-                notification_type='comment_reply',
-                story_id=parent_comment.story_id,
-                comment_id=reply.id,
-                trigger_id=anonymous_id,
-                message=message
-            )
+            enqueue_notification('comment_reply', comment_id=reply.id)
         
         db.session.commit()
+        invalidate_cache(f'comments:{parent_comment.story_id}')
         
         return jsonify({
             'success': True,
@@ -165,6 +190,9 @@ def toggle_comment_reaction(comment_id):
         # Check if comment exists
         comment = Comment.query.get_or_404(comment_id)
         
+        if reaction_buffer.enabled:
+            return buffer_comment_reaction(comment, anonymous_id, reaction_type)
+        
         # Check if reaction already exists
         existing_reaction = CommentReaction.query.filter_by(
             comment_id=comment_id,
@@ -186,21 +214,12 @@ def toggle_comment_reaction(comment_id):
             db.session.add(reaction)
             action = 'added'
             
-            # Create notification for comment author
-            if comment.anonymous_id != anonymous_id:
-                story = Story.query.get(comment.story_id)
-                reaction_emoji = {'heart': '❤️', 'hug': '🤗', 'strength': '✨'}[reaction_type]
-                message = f"Someone reacted to your comment with {reaction_emoji}"
-                create_notification(
-                    recipient_id=comment.anonymous_id,
-                    notification_type='comment_reaction',
-                    story_id=comment.story_id,
-                    comment_id=comment_id,
-                    trigger_id=anonymous_id,
-                    message=message
-                )
+            # Queue notification for comment author
+            notify_comment_reaction(comment, anonymous_id, reaction_type)
         
+        Story.bump_conversation_version(comment.story_id)
         db.session.commit()
+        invalidate_cache(f'comments:{comment.story_id}')
         
         # Get updated reaction counts
         updated_comment = Comment.query.get(comment_id)
@@ -216,6 +235,30 @@ def toggle_comment_reaction(comment_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def buffer_comment_reaction(comment, anonymous_id, reaction_type):
+    """Queue a comment reaction toggle in the write-behind buffer"""
+    def stored():
+        return db.session.query(CommentReaction.query.filter_by(
+            comment_id=comment.id,
+            anonymous_id=anonymous_id,
+            reaction_type=reaction_type
+        ).exists()).scalar()
+    
+    op = reaction_buffer.submit(COMMENT, comment.id, anonymous_id, reaction_type, None, stored)
+    action = 'added' if op == ADD else 'removed'
+    
+    # Stored counts plus this worker's unflushed changes
+    reaction_counts = get_reaction_counts_for([comment.id]).get(comment.id) or empty_reaction_counts()
+    for pending_type, delta in reaction_buffer.pending_deltas(COMMENT, comment.id).items():
+        reaction_counts[pending_type] = max(reaction_counts.get(pending_type, 0) + delta, 0)
+    
+    return jsonify({
+        'success': True,
+        'action': action,
+        'reaction_counts': reaction_counts,
+        'anonymous_id': anonymous_id
+    })
+
 @comments_bp.route('/comments/<int:comment_id>', methods=['PUT'])
 def update_comment(comment_id):
     """Update a comment (only by the author)"""
@@ -233,8 +276,10 @@ def update_comment(comment_id):
         if 'content' in data:
             comment.content = data['content'].strip()
             comment.updated_at = datetime.utcnow()
+            Story.bump_conversation_version(comment.story_id)
         
         db.session.commit()
+        invalidate_cache(f'comments:{comment.story_id}')
         
         return jsonify({
             'success': True,
@@ -257,12 +302,21 @@ def delete_comment(comment_id):
         if comment.anonymous_id != anonymous_id:
             return jsonify({'success': False, 'error': 'Unauthorized'}), 403
         
+        # Keep the parent's stored reply count in step
+        if comment.parent_comment_id and not comment.is_deleted:
+            Comment.query.filter_by(id=comment.parent_comment_id).update(
+                {'reply_count': db.func.max(Comment.reply_count - 1, 0)},
+                synchronize_session=False
+            )
+        
         # Soft delete
         comment.is_deleted = True
         comment.content = '[Comment deleted]'
         comment.updated_at = datetime.utcnow()
+        Story.bump_conversation_version(comment.story_id)
         
         db.session.commit()
+        invalidate_cache(f'comments:{comment.story_id}')
         
         return jsonify({
             'success': True,
@@ -1,6 +1,7 @@
-from flask import Blueprint, request, jsonify
-from src.models.story import db
-from src.models.comment import Notification
+from flask import Blueprint, Response, current_app, request, jsonify
+from src.models.story import db, Story
+from src.models.comment import Notification, NotificationActor, NotificationCounter, get_story_titles
+from src.services.notification_stream import notification_hub, publish_notification_event, RETRY_MS
 import uuid
 
 notifications_bp = Blueprint('notifications', __name__)
@@ -29,20 +30,22 @@ def get_notifications():
         if unread_only:
             query = query.filter_by(is_read=False)
         
-        # Get total count
-        total_count = query.count()
+        # Get counts from the maintained counters
+        unread_count, total_count = NotificationCounter.get_counts(anonymous_id)
         
-        # Get paginated results
-        notifications = query.order_by(Notification.created_at.desc()).offset(offset).limit(limit).all()
+        # Get paginated results with story titles from the same query
+        rows = query.outerjoin(Story, Story.id == Notification.story_id).add_columns(
+            Story.title
+        ).order_by(Notification.created_at.desc()).offset(offset).limit(limit).all()
         
         return jsonify({
             'success': True,
-            'notifications': [notification.to_dict() for notification in notifications],
-            'total_count': total_count,
-            'unread_count': Notification.query.filter_by(
-                recipient_anonymous_id=anonymous_id, 
-                is_read=False
-            ).count(),
+            'notifications': [
+                notification.to_dict({notification.story_id: story_title})
+                for notification, story_title in rows
+            ],
+            'total_count': unread_count if unread_only else total_count,
+            'unread_count': unread_count,
             'anonymous_id': anonymous_id
         })
         
@@ -55,10 +58,7 @@ def get_unread_count():
     try:
         anonymous_id = get_anonymous_id()
         
-        unread_count = Notification.query.filter_by(
-            recipient_anonymous_id=anonymous_id,
-            is_read=False
-        ).count()
+        unread_count, _ = NotificationCounter.get_counts(anonymous_id)
         
         return jsonify({
             'success': True,
@@ -69,6 +69,42 @@ def get_unread_count():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@notifications_bp.route('/notifications/stream', methods=['GET'])
+def stream_notifications():
+    """Stream new notifications and unread count changes as Server-Sent Events"""
+    try:
+        # EventSource cannot send custom headers, so the ID may come as a parameter
+        anonymous_id = request.headers.get('X-Anonymous-ID') or request.args.get('anonymous_id')
+        if not anonymous_id:
+            return jsonify({'success': False, 'error': 'Anonymous ID is required'}), 400
+        
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+        
+        subscriber = notification_hub.subscribe(current_app._get_current_object(), anonymous_id)
+        if subscriber is None:
+            response = jsonify({'success': False, 'error': 'Too many open notification streams'})
+            response.headers['Retry-After'] = str(RETRY_MS // 1000)
+            return response, 503
+        
+        try:
+            initial = notification_hub.initial_events(anonymous_id, last_event_id)
+        except Exception:
+            notification_hub.unsubscribe(subscriber)
+            raise
+        
+        return Response(
+            notification_hub.stream(subscriber, initial),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @notifications_bp.route('/notifications/<int:notification_id>/read', methods=['PUT'])
 def mark_notification_read(notification_id):
     """Mark a specific notification as read"""
@@ -80,12 +116,16 @@ def mark_notification_read(notification_id):
             recipient_anonymous_id=anonymous_id
         ).first_or_404()
         
-        notification.is_read = True
+        # Only the request that flips the flag moves the unread counter
+        marked = Notification.query.filter_by(id=notification.id, is_read=False).update({'is_read': True})
+        if marked:
+            NotificationCounter.adjust(anonymous_id, unread_delta=-1)
+            publish_notification_event(anonymous_id, 'read', notification.id)
         db.session.commit()
         
         return jsonify({
             'success': True,
-            'notification': notification.to_dict()
+            'notification': notification.to_dict(get_story_titles([notification.story_id]))
         })
         
     except Exception as e:
@@ -103,6 +143,9 @@ def mark_all_notifications_read():
             recipient_anonymous_id=anonymous_id,
             is_read=False
         ).update({'is_read': True})
+        if updated_count:
+            NotificationCounter.adjust(anonymous_id, unread_delta=-updated_count)
+            publish_notification_event(anonymous_id, 'read')
         
         db.session.commit()
         
@@ -122,12 +165,21 @@ def delete_notification(notification_id):
     try:
         anonymous_id = get_anonymous_id()
         
-        notification = Notification.query.filter_by(
-            id=notification_id,
-            recipient_anonymous_id=anonymous_id
-        ).first_or_404()
-        
-        db.session.delete(notification)
+        # RETURNING reports the read state at deletion time, so the unread count stays exact
+        deleted = db.session.execute(
+            db.delete(Notification).where(
+                Notification.id == notification_id,
+                Notification.recipient_anonymous_id == anonymous_id
+            ).returning(Notification.is_read)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if deleted is None:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Notification not found'}), 404
+        
+        NotificationActor.query.filter_by(notification_id=notification_id).delete()
+        NotificationCounter.adjust(anonymous_id, unread_delta=0 if deleted.is_read else -1, total_delta=-1)
+        publish_notification_event(anonymous_id, 'deleted', notification_id)
         db.session.commit()
         
         return jsonify({
@@ -139,28 +191,3 @@ def delete_notification(notification_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@notifications_bp.route('/notifications/cleanup', methods=['POST'])
-def cleanup_old_notifications():
-    """Clean up old notifications (older than 30 days)"""
-    try:
-        from datetime import datetime, timedelta
-        
-        # Delete notifications older than 30 days
-        cutoff_date = datetime.utcnow() - timedelta(days=30)
-        
-        deleted_count = Notification.query.filter(
-            Notification.created_at < cutoff_date
-        ).delete()
-        
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'deleted_count': deleted_count,
-            'message': f'Cleaned up {deleted_count} old notifications'
-        })
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'success': False, 'error': str(e)}), 500
-
@@ -1,32 +1,85 @@
 from flask import Blueprint, request, jsonify
 from src.models.story import db, Story
-from src.models.comment import Comment
-from src.models.sharing import SharedConversation, ForwardedEmail
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import os
+from src.models.sharing import SharedConversation, ArchivedSharedConversation, ForwardedEmail, EmailOutbox, StorySharingStats
+from src.services.conversation_cache import get_conversation_snapshot
+from src.services.share_filter import share_id_filter
+from src.utils.ids import parse_id_list
+from datetime import datetime, timedelta
 import re
 
 sharing_bp = Blueprint('sharing', __name__)
 
+MAX_BULK_RECIPIENTS = 50
+EMAIL_LINK_EXPIRY_DAYS = 30
+SHARE_URL_PLACEHOLDER = '__SHARE_URL__'
+MAX_STATS_STORY_IDS = 100
+
 def validate_email(email):
     """Basic email validation"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
-def send_email(recipient_email, subject, html_content, text_content=None):
-    """Send email using SMTP (placeholder implementation)"""
-    try:
-        # This is a placeholder - in production, you'd use a service like SendGrid, AWS SES, etc.
-        # For now, we'll just log the email content and mark as sent
-        print(f"EMAIL SENT TO: {recipient_email}")
-        print(f"SUBJECT: {subject}")
-        print(f"CONTENT: {html_content}")
-        return True
-    except Exception as e:
-        print(f"Email sending failed: {str(e)}")
-        return False
+def render_forward_email(story, share_url, sender_name=None, personal_message=None):
+    """Render the subject, HTML and plain text of a story forward email"""
+    sender_text = f"{sender_name} " if sender_name else "Someone "
+    category_name = story.category.name if story.category else ''
+    subject = f"{sender_text}shared a healing story with you from SupportGrove"
+    
+    # Create HTML email content
+    html_content = f"""
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+            <h2 style="color: #4a5d23;">Someone shared a healing story with you</h2>
+            
+            <p>Hi there,</p>
+            
+            <p><strong>{sender_text}</strong>thought you might find this story and conversation meaningful:</p>
+            
+            <div style="background-color: #f8f9f5; padding: 20px; border-left: 4px solid #4a5d23; margin: 20px 0;">
+                <h3 style="margin: 0 0 10px 0; color: #4a5d23;">"{story.title}"</h3>
+                <p style="margin: 0; color: #666;">Category: {category_name}</p>
+                <p style="margin: 10px 0 0 0; font-size: 14px;">
+                    {story.hashtags if story.hashtags else ''}
+                </p>
+            </div>
+            
+            {f'<div style="background-color: #e8f4fd; padding: 15px; border-radius: 5px; margin: 20px 0;"><p style="margin: 0; font-style: italic;">"{personal_message}"</p><p style="margin: 5px 0 0 0; font-size: 12px; color: #666;">- {sender_name or "Anonymous"}</p></div>' if personal_message else ''}
+            
+            <div style="margin: 30px 0;">
+                <a href="{share_url}" style="background-color: #4a5d23; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px; display: inline-block;">Read the Full Conversation</a>
+            </div>
+            
+            <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
+            
+            <div style="text-align: center; color: #666; font-size: 14px;">
+                <p><strong>SupportGrove.Online</strong> - Anonymous Support Community</p>
+                <p style="font-style: italic;">"We are not alone. Our truth connects us. Our stories are powerful and healing."</p>
+                <p>This is a safe space for sharing experiences with addiction recovery, trauma healing, mental health, and life transitions.</p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    
+    # Plain text alternative for clients that don't render HTML
+    text_lines = [
+        f"{sender_text}thought you might find this story and conversation meaningful:",
+        "",
+        f'"{story.title}"',
+        f"Category: {category_name}",
+    ]
+    if personal_message:
+        text_lines += ["", f'"{personal_message}"', f"- {sender_name or 'Anonymous'}"]
+    text_lines += [
+        "",
+        f"Read the full conversation: {share_url}",
+        "",
+        "SupportGrove.Online - Anonymous Support Community",
+    ]
+    text_content = "\n".join(text_lines)
+    
+    return subject, html_content, text_content
 
 @sharing_bp.route('/stories/<int:story_id>/share-link', methods=['POST'])
 def create_share_link(story_id):
@@ -51,7 +104,9 @@ def create_share_link(story_id):
         )
         
         db.session.add(shared_conversation)
+        StorySharingStats.adjust(story_id, shares=1)
         db.session.commit()
+        share_id_filter.add(shared_conversation.share_id)
         
         # Return the shareable link
         base_url = request.host_url.rstrip('/')
@@ -94,7 +149,7 @@ def forward_via_email(story_id):
             story_id=story_id,
             shared_by=sender_name,
             personal_message=personal_message,
-            expires_in_days=30  # Email links expire in 30 days
+            expires_in_days=EMAIL_LINK_EXPIRY_DAYS  # Email links expire in 30 days
         )
         
         db.session.add(shared_conversation)
@@ -104,71 +159,138 @@ def forward_via_email(story_id):
         base_url = request.host_url.rstrip('/')
         share_url = f"{base_url}/shared/{shared_conversation.share_id}"
         
-        sender_text = f"{sender_name} " if sender_name else "Someone "
-        subject = f"{sender_text}shared a healing story with you from SupportGrove"
-        
-        # Create HTML email content
-        html_content = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <h2 style="color: #4a5d23;">Someone shared a healing story with you</h2>
-                
-                <p>Hi there,</p>
-                
-                <p><strong>{sender_text}</strong>thought you might find this story and conversation meaningful:</p>
-                
-                <div style="background-color: #f8f9f5; padding: 20px; border-left: 4px solid #4a5d23; margin: 20px 0;">
-                    <h3 style="margin: 0 0 10px 0; color: #4a5d23;">"{story.title}"</h3>
-                    <p style="margin: 0; color: #666;">Category: {story.category}</p>
-                    <p style="margin: 10px 0 0 0; font-size: 14px;">
-                        {story.hashtags if story.hashtags else ''}
-                    </p>
-                </div>
-                
-                {f'<div style="background-color: #e8f4fd; padding: 15px; border-radius: 5px; margin: 20px 0;"><p style="margin: 0; font-style: italic;">"{personal_message}"</p><p style="margin: 5px 0 0 0; font-size: 12px; color: #666;">- {sender_name or "Anonymous"}</p></div>' if personal_message else ''}
-                
-                <div style="margin: 30px 0;">
-                    <a href="{share_url}" style="background-color: #4a5d23; color: white; padding: 12px 24px; text-decoration: none; border-radius: 5px; display: inline-block;">Read the Full Conversation</a>
-                </div>
-                
-                <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-                
-                <div style="text-align: center; color: #666; font-size: 14px;">
-                    <p><strong>SupportGrove.Online</strong> - Anonymous Support Community</p>
-                    <p style="font-style: italic;">"We are not alone. Our truth connects us. Our stories are powerful and healing."</p>
-                    <p>This is a safe space for sharing experiences with addiction recovery, trauma healing, mental health, and life transitions.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # Send email
-        email_sent = send_email(recipient_email, subject, html_content)
-        
-        if email_sent:
-            # Record the forwarded email
-            forwarded_email = ForwardedEmail(
-                story_id=story_id,
-                recipient_email=recipient_email,
-                sender_name=sender_name,
-                personal_message=personal_message
-            )
-            
-            db.session.add(forwarded_email)
-            db.session.commit()
-            
-            return jsonify({
-                'success': True,
-                'message': 'Story forwarded successfully via email',
+        subject, html_content, text_content = render_forward_email(story, share_url, sender_name, personal_message)
+        
+        # Queue the email; the background sender delivers it and updates the status
+        forwarded_email = ForwardedEmail(
+            story_id=story_id,
+            recipient_email=recipient_email,
+            sender_name=sender_name,
+            personal_message=personal_message
+        )
+        db.session.add(forwarded_email)
+        db.session.add(EmailOutbox(
+            forwarded_email=forwarded_email,
+            recipient_email=recipient_email,
+            subject=subject,
+            html_content=html_content,
+            text_content=text_content
+        ))
+        StorySharingStats.adjust(story_id, shares=1, forwards=1)
+        db.session.commit()
+        share_id_filter.add(shared_conversation.share_id)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Story forwarded successfully via email',
+            'share_url': share_url,
+            'forwarded_email': forwarded_email.to_dict()
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@sharing_bp.route('/stories/<int:story_id>/forward/email/bulk', methods=['POST'])
+def forward_via_email_bulk(story_id):
+    """Forward a story conversation to several email recipients at once"""
+    try:
+        # Check if story exists
+        story = Story.query.get(story_id)
+        if not story:
+            return jsonify({'error': 'Story not found'}), 404
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Request data required'}), 400
+        
+        sender_name = (data.get('sender_name') or '').strip() or None
+        personal_message = (data.get('personal_message') or '').strip() or None
+        recipient_emails = data.get('recipient_emails')
+        if not isinstance(recipient_emails, list) or not recipient_emails:
+            return jsonify({'error': 'A list of recipient emails is required'}), 400
+        
+        # Validate emails, dropping duplicates
+        recipients = []
+        seen = set()
+        invalid = []
+        for email in recipient_emails:
+            email = email.strip() if isinstance(email, str) else ''
+            if not validate_email(email):
+                invalid.append(email)
+            elif email.lower() not in seen:
+                seen.add(email.lower())
+                recipients.append(email)
+        if invalid:
+            return jsonify({'error': 'Valid recipient emails required', 'invalid_emails': invalid}), 400
+        if len(recipients) > MAX_BULK_RECIPIENTS:
+            return jsonify({'error': f'At most {MAX_BULK_RECIPIENTS} recipients per request'}), 400
+        
+        # Render the email once; each recipient gets their own share link
+        subject, html_template, text_template = render_forward_email(
+            story, SHARE_URL_PLACEHOLDER, sender_name, personal_message
+        )
+        base_url = request.host_url.rstrip('/')
+        now = datetime.utcnow()
+        share_ids = SharedConversation.generate_share_ids(len(recipients))
+        
+        # Insert share links, forwards and outbox rows as three batched statements
+        db.session.execute(db.insert(SharedConversation), [{
+            'story_id': story_id,
+            'share_id': share_id,
+            'shared_by': sender_name,
+            'personal_message': personal_message,
+            'created_at': now,
+            'expires_at': now + timedelta(days=EMAIL_LINK_EXPIRY_DAYS),
+            'view_count': 0
+        } for share_id in share_ids])
+        # Recipients are unique, so RETURNING rows are matched back by email
+        forwarded_email_ids = dict(db.session.execute(
+            db.insert(ForwardedEmail).returning(ForwardedEmail.recipient_email, ForwardedEmail.id),
+            [{
+                'story_id': story_id,
+                'recipient_email': email,
+                'sender_name': sender_name,
+                'personal_message': personal_message,
+                'sent_at': now,
+                'status': 'queued'
+            } for email in recipients]
+        ).all())
+        
+        forwarded = []
+        outbox_rows = []
+        for email, share_id in zip(recipients, share_ids):
+            forwarded_email_id = forwarded_email_ids[email]
+            share_url = f"{base_url}/shared/{share_id}"
+            outbox_rows.append({
+                'forwarded_email_id': forwarded_email_id,
+                'recipient_email': email,
+                'subject': subject,
+                'html_content': html_template.replace(SHARE_URL_PLACEHOLDER, share_url),
+                'text_content': text_template.replace(SHARE_URL_PLACEHOLDER, share_url),
+                'status': 'queued',
+                'attempts': 0,
+                'next_attempt_at': now,
+                'created_at': now
+            })
+            forwarded.append({
+                'recipient_email': email,
+                'share_id': share_id,
                 'share_url': share_url,
-                'forwarded_email': forwarded_email.to_dict()
+                'forwarded_email_id': forwarded_email_id,
+                'status': 'queued'
             })
-        else:
-            db.session.rollback()
-            return jsonify({'error': 'Failed to send email'}), 500
-            
+        db.session.execute(db.insert(EmailOutbox), outbox_rows)
+        StorySharingStats.adjust(story_id, shares=len(recipients), forwards=len(recipients))
+        db.session.commit()
+        share_id_filter.add(*share_ids)
+        
+        return jsonify({
+            'success': True,
+            'message': f'Story forwarded to {len(forwarded)} recipients via email',
+            'forwarded': forwarded
+        })
+        
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -177,11 +299,21 @@ def forward_via_email(story_id):
 def view_shared_conversation(share_id):
     """View a shared conversation thread"""
     try:
-        # Find the shared conversation
-        shared_conversation = SharedConversation.query.filter_by(share_id=share_id).first()
-        if not shared_conversation:
+        # Reject IDs that were never issued without querying the database
+        if not share_id_filter.might_contain(share_id):
             return jsonify({'error': 'Shared conversation not found'}), 404
         
+        # Find the shared conversation and its story's conversation version
+        row = db.session.query(SharedConversation, Story.conversation_version).join(
+            Story, Story.id == SharedConversation.story_id
+        ).filter(SharedConversation.share_id == share_id).first()
+        if not row:
+            # Expired links are moved to the archive by a background job
+            if ArchivedSharedConversation.query.filter_by(share_id=share_id).first():
+                return jsonify({'error': 'This shared conversation has expired'}), 410
+            return jsonify({'error': 'Shared conversation not found'}), 404
+        shared_conversation, conversation_version = row
+        
         # Check if expired
         if shared_conversation.is_expired():
             return jsonify({'error': 'This shared conversation has expired'}), 410
@@ -189,20 +321,8 @@ def view_shared_conversation(share_id):
         # Increment view count
         shared_conversation.increment_view_count()
         
-        # Get the story and its comments
-        story = shared_conversation.story
-        comments = Comment.query.filter_by(story_id=story.id, parent_comment_id=None).order_by(Comment.created_at.asc()).all()
-        
-        # Build the response with full conversation
-        story_data = story.to_dict()
-        story_data['comments'] = []
-        
-        for comment in comments:
-            comment_data = comment.to_dict()
-            # Get replies for this comment
-            replies = Comment.query.filter_by(parent_comment_id=comment.id).order_by(Comment.created_at.asc()).all()
-            comment_data['replies'] = [reply.to_dict() for reply in replies]
-            story_data['comments'].append(comment_data)
+        # Get the story with its full conversation, cached per conversation version
+        story_data = get_conversation_snapshot(shared_conversation.story_id, conversation_version)
         
         return jsonify({
             'success': True,
@@ -211,7 +331,7 @@ def view_shared_conversation(share_id):
             'meta': {
                 'shared_by': shared_conversation.shared_by,
                 'personal_message': shared_conversation.personal_message,
-                'view_count': shared_conversation.view_count
+                'view_count': shared_conversation.current_view_count
             }
         })
         
@@ -222,25 +342,41 @@ def view_shared_conversation(share_id):
 def get_sharing_stats(story_id):
     """Get sharing statistics for a story"""
     try:
-        story = Story.query.get(story_id)
-        if not story:
+        # One key lookup on the rollup; views still buffered show up after the next flush
+        row = db.session.query(Story.id, StorySharingStats).outerjoin(
+            StorySharingStats, StorySharingStats.story_id == Story.id
+        ).filter(Story.id == story_id).first()
+        if not row:
             return jsonify({'error': 'Story not found'}), 404
-        
-        # Count shares and email forwards
-        share_count = SharedConversation.query.filter_by(story_id=story_id).count()
-        email_count = ForwardedEmail.query.filter_by(story_id=story_id).count()
-        total_views = db.session.query(db.func.sum(SharedConversation.view_count)).filter_by(story_id=story_id).scalar() or 0
+        stats = row[1].to_dict() if row[1] else StorySharingStats.empty_dict()
         
         return jsonify({
             'success': True,
-            'stats': {
-                'share_count': share_count,
-                'email_forwards': email_count,
-                'total_views': total_views,
-                'total_forwards': share_count + email_count
-            }
+            'stats': stats
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@sharing_bp.route('/stories/sharing-stats')
+def get_sharing_stats_batch():
+    """Get sharing statistics for several stories, e.g. for a story owner's dashboard"""
+    try:
+        try:
+            story_ids = parse_id_list(request.args.get('story_ids', ''))
+        except ValueError:
+            return jsonify({'error': 'story_ids must be a comma separated list of IDs'}), 400
+        if not story_ids:
+            return jsonify({'error': 'story_ids is required'}), 400
+        if len(story_ids) > MAX_STATS_STORY_IDS:
+            return jsonify({'error': f'At most {MAX_STATS_STORY_IDS} stories can be requested at once'}), 400
+        
+        stats = StorySharingStats.get_many(story_ids)
+        
+        return jsonify({
+            'success': True,
+            'stats': {str(story_id): story_stats for story_id, story_stats in stats.items()}
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
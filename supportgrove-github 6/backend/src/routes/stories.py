@@ -1,11 +1,22 @@
 from flask import Blueprint, jsonify, request
-from src.models.story import db, Story, Response, Reaction, Report, Category
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.story import db, Story, StoryHashtag, Response, Reaction, Report, Category
+from src.services.category_cache import get_category_snapshot, invalidate_category_snapshot
+from src.models.comment import CommentReaction
+from src.services.reaction_buffer import ADD, COMMENT, REMOVE, STORY, reaction_buffer
+from src.services.hashtags import normalize_hashtag, clean_hashtags, index_story_hashtags
+from src.services.search import search_story_index
+from src.services.response_cache import cached, invalidate_cache
+from src.services import trending
+from src.utils.ids import parse_id_list
+from src.utils.pagination import keyset_paginate
 from datetime import datetime
 import uuid
 
 stories_bp = Blueprint('stories', __name__)
 
 @stories_bp.route('/stories', methods=['GET'])
+@cached('stories', ttl=15, tags=['stories'])
 def get_stories():
     """Get stories with optional filtering"""
     try:
@@ -21,6 +32,10 @@ def get_stories():
         if category_id:
             query = query.filter_by(category_id=category_id)
         
+        # Cursor mode: an empty ``cursor`` parameter requests the first page
+        if 'cursor' in request.args:
+            return get_stories_by_cursor(query, sort_by, per_page)
+        
         # Sorting
         if sort_by == 'heart_count':
             query = query.order_by(Story.heart_count.desc())
@@ -55,6 +70,52 @@ def get_stories():
             'error': str(e)
         }), 500
 
+def get_stories_by_cursor(query, sort_by, per_page):
+    """Seek to the next page of stories without OFFSET or COUNT(*)"""
+    sort_columns = {
+        'heart_count': Story.heart_count,
+        'response_count': Story.response_count
+    }
+    columns = [sort_columns.get(sort_by, Story.created_at), Story.id]
+    per_page = max(1, min(per_page, 100))
+    include_total = request.args.get('include_total', 'false').lower() == 'true'
+    
+    # Exact totals cost a COUNT(*); otherwise approximate from category aggregates
+    if include_total:
+        total = query.count()
+    else:
+        categories = get_category_snapshot()
+        category_id = request.args.get('category_id', type=int)
+        if category_id:
+            total = categories.get(category_id, {}).get('story_count', 0)
+        else:
+            total = sum(category['story_count'] for category in categories.values())
+    
+    try:
+        stories, next_cursor = keyset_paginate(
+            query,
+            columns,
+            cursor=request.args.get('cursor'),
+            limit=per_page
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'stories': [story.to_dict(include_content=False) for story in stories],
+        'pagination': {
+            'per_page': per_page,
+            'total': total,
+            'total_is_exact': include_total,
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None
+        }
+    })
+
 @stories_bp.route('/stories', methods=['POST'])
 def create_story():
     """Create a new story with guided sharing process"""
@@ -80,19 +141,7 @@ def create_story():
         
         # Process hashtags
         import json
-        hashtags = data.get('hashtags', [])
-        if isinstance(hashtags, list):
-            # Clean and validate hashtags
-            clean_hashtags = []
-            for tag in hashtags:
-                if isinstance(tag, str) and tag.strip():
-                    # Remove # if present and clean
-                    clean_tag = tag.strip().lstrip('#').lower()
-                    if clean_tag and len(clean_tag) <= 50:  # Limit hashtag length
-                        clean_hashtags.append(clean_tag)
-            hashtags_json = json.dumps(clean_hashtags[:10])  # Limit to 10 hashtags
-        else:
-            hashtags_json = json.dumps([])
+        hashtags = clean_hashtags(data.get('hashtags', []))
         
         # Create story
         story = Story(
@@ -100,15 +149,21 @@ def create_story():
             content=data['content'],
             category_id=data['category_id'],
             pseudonym=data.get('pseudonym', ''),
-            hashtags=hashtags_json,
+            hashtags=json.dumps(hashtags),
             healing_process=data.get('healing_process', ''),
             next_steps=data.get('next_steps', ''),
             trigger_warning=data.get('trigger_warning', False),
-            trigger_tags=data.get('trigger_tags', '')
+            trigger_tags=data.get('trigger_tags', ''),
+            created_at=datetime.utcnow()
         )
+        index_story_hashtags(story, hashtags)
+        trending.record_hashtag_usage(hashtags, story.created_at)
         
         db.session.add(story)
         db.session.commit()
+        trending.invalidate_rankings()
+        invalidate_category_snapshot()
+        invalidate_cache('stories', 'categories', 'trending')
         
         return jsonify({
             'success': True,
@@ -124,6 +179,7 @@ def create_story():
         }), 500
 
 @stories_bp.route('/stories/<int:story_id>', methods=['GET'])
+@cached('story', ttl=60, tags=lambda story_id: [f'story:{story_id}'])
 def get_story(story_id):
     """Get a specific story with responses"""
     try:
@@ -183,9 +239,10 @@ def create_response(story_id):
         db.session.add(response)
         
         # Update story response count
-        story.response_count += 1
+        Story.adjust_counter(story_id, 'response_count', 1)
         
         db.session.commit()
+        invalidate_cache(f'story:{story_id}')
         
         return jsonify({
             'success': True,
@@ -204,12 +261,6 @@ def create_response(story_id):
 def add_reaction(story_id):
     """Add or update a reaction to a story"""
     try:
-        story = Story.query.filter_by(
-            id=story_id,
-            is_approved=True,
-            is_flagged=False
-        ).first_or_404()
-        
         data = request.get_json()
         
         if not data or 'reaction_type' not in data or 'anonymous_id' not in data:
@@ -221,51 +272,54 @@ def add_reaction(story_id):
         reaction_type = data['reaction_type']
         anonymous_id = data['anonymous_id']
         
-        if reaction_type not in ['heart', 'hug', 'strength']:
+        if reaction_type not in Story.REACTION_COUNTERS:
             return jsonify({
                 'success': False,
                 'error': 'Invalid reaction type'
             }), 400
         
-        # Check if reaction already exists
-        existing_reaction = Reaction.query.filter_by(
-            story_id=story_id,
-            anonymous_id=anonymous_id,
-            reaction_type=reaction_type
-        ).first()
+        if reaction_buffer.enabled:
+            return buffer_story_reaction(story_id, anonymous_id, reaction_type, ADD)
+        
+        # Insert the reaction unless this user already gave it
+        inserted = db.session.execute(
+            sqlite_insert(Reaction).values(
+                story_id=story_id,
+                reaction_type=reaction_type,
+                anonymous_id=anonymous_id,
+                created_at=datetime.utcnow()
+            ).on_conflict_do_nothing(
+                index_elements=['story_id', 'anonymous_id', 'reaction_type']
+            )
+        ).rowcount
+        
+        # Increment in SQL and read the fresh counts from the same statement
+        counts = Story.adjust_counter(story_id, Story.REACTION_COUNTERS[reaction_type], 1, listed_only=True)
+        
+        if counts is None:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'Story not found'
+            }), 404
         
-        if existing_reaction:
+        if not inserted:
+            db.session.rollback()
             return jsonify({
                 'success': False,
                 'error': 'You have already reacted with this type'
             }), 400
         
-        # Create new reaction
-        reaction = Reaction(
-            story_id=story_id,
-            reaction_type=reaction_type,
-            anonymous_id=anonymous_id
-        )
-        
-        db.session.add(reaction)
-        
-        # Update story reaction counts
-        if reaction_type == 'heart':
-            story.heart_count += 1
-        elif reaction_type == 'hug':
-            story.hug_count += 1
-        elif reaction_type == 'strength':
-            story.strength_count += 1
-        
         db.session.commit()
+        invalidate_cache(f'story:{story_id}')
         
         return jsonify({
             'success': True,
             'message': f'{reaction_type.title()} reaction added',
             'counts': {
-                'heart_count': story.heart_count,
-                'hug_count': story.hug_count,
-                'strength_count': story.strength_count
+                'heart_count': counts['heart_count'],
+                'hug_count': counts['hug_count'],
+                'strength_count': counts['strength_count']
             }
         })
         
@@ -288,32 +342,37 @@ def remove_reaction(story_id):
                 'error': 'reaction_type and anonymous_id are required'
             }), 400
         
-        reaction = Reaction.query.filter_by(
+        reaction_type = data['reaction_type']
+        
+        if reaction_buffer.enabled:
+            return buffer_story_reaction(story_id, data['anonymous_id'], reaction_type, REMOVE)
+        
+        deleted = Reaction.query.filter_by(
             story_id=story_id,
             anonymous_id=data['anonymous_id'],
-            reaction_type=data['reaction_type']
-        ).first_or_404()
+            reaction_type=reaction_type
+        ).delete(synchronize_session=False)
         
-        story = Story.query.get(story_id)
+        if not deleted or reaction_type not in Story.REACTION_COUNTERS:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'Reaction not found'
+            }), 404
         
-        # Update story reaction counts
-        if reaction.reaction_type == 'heart':
-            story.heart_count = max(0, story.heart_count - 1)
-        elif reaction.reaction_type == 'hug':
-            story.hug_count = max(0, story.hug_count - 1)
-        elif reaction.reaction_type == 'strength':
-            story.strength_count = max(0, story.strength_count - 1)
+        # Decrement in SQL and read the fresh counts from the same statement
+        counts = Story.adjust_counter(story_id, Story.REACTION_COUNTERS[reaction_type], -1)
         
-        db.session.delete(reaction)
         db.session.commit()
+        invalidate_cache(f'story:{story_id}')
         
         return jsonify({
             'success': True,
-            'message': f'{reaction.reaction_type.title()} reaction removed',
+            'message': f'{reaction_type.title()} reaction removed',
             'counts': {
-                'heart_count': story.heart_count,
-                'hug_count': story.hug_count,
-                'strength_count': story.strength_count
+                'heart_count': counts['heart_count'] if counts else 0,
+                'hug_count': counts['hug_count'] if counts else 0,
+                'strength_count': counts['strength_count'] if counts else 0
             }
         })
         
@@ -324,6 +383,125 @@ def remove_reaction(story_id):
             'error': str(e)
         }), 500
 
+def buffer_story_reaction(story_id, anonymous_id, reaction_type, op):
+    """Queue a story reaction change in the write-behind buffer"""
+    if op == ADD:
+        story = Story.query.filter_by(id=story_id, is_approved=True, is_flagged=False).first()
+    else:
+        story = Story.query.get(story_id)
+    if not story:
+        return jsonify({
+            'success': False,
+            'error': 'Story not found'
+        }), 404
+    
+    if reaction_type not in Story.REACTION_COUNTERS:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid reaction type'
+        }), 400
+    
+    def stored():
+        return db.session.query(Reaction.query.filter_by(
+            story_id=story_id,
+            anonymous_id=anonymous_id,
+            reaction_type=reaction_type
+        ).exists()).scalar()
+    
+    if reaction_buffer.submit(STORY, story_id, anonymous_id, reaction_type, op, stored) is None:
+        if op == ADD:
+            return jsonify({
+                'success': False,
+                'error': 'You have already reacted with this type'
+            }), 400
+        return jsonify({
+            'success': False,
+            'error': 'Reaction not found'
+        }), 404
+    
+    # Stored counts plus this worker's unflushed changes
+    deltas = reaction_buffer.pending_deltas(STORY, story_id)
+    counts = {
+        counter: max(getattr(story, counter) + deltas.get(pending_type, 0), 0)
+        for pending_type, counter in Story.REACTION_COUNTERS.items()
+    }
+    
+    return jsonify({
+        'success': True,
+        'message': f"{reaction_type.title()} reaction {'added' if op == ADD else 'removed'}",
+        'counts': counts
+    })
+
+MAX_REACTION_STATE_IDS = 100
+
+def reaction_state_query(anonymous_id, story_ids, comment_ids):
+    """Build a single query for one user's reactions on stories and comments"""
+    return db.union_all(
+        db.select(db.literal('story').label('kind'), Reaction.story_id.label('target_id'), Reaction.reaction_type).where(
+            Reaction.story_id.in_(story_ids), Reaction.anonymous_id == anonymous_id
+        ),
+        db.select(db.literal('comment').label('kind'), CommentReaction.comment_id.label('target_id'), CommentReaction.reaction_type).where(
+            CommentReaction.comment_id.in_(comment_ids), CommentReaction.anonymous_id == anonymous_id
+        )
+    )
+
+@stories_bp.route('/reactions/state', methods=['GET'])
+def get_reaction_state():
+    """Get the reactions the current user gave to a page of stories and comments"""
+    try:
+        anonymous_id = request.headers.get('X-Anonymous-ID')
+        if not anonymous_id:
+            return jsonify({
+                'success': False,
+                'error': 'X-Anonymous-ID header is required'
+            }), 400
+        
+        try:
+            story_ids = parse_id_list(request.args.get('story_ids', ''))
+            comment_ids = parse_id_list(request.args.get('comment_ids', ''))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'story_ids and comment_ids must be comma separated integers'
+            }), 400
+        
+        if len(story_ids) + len(comment_ids) > MAX_REACTION_STATE_IDS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {MAX_REACTION_STATE_IDS} IDs can be requested at once'
+            }), 400
+        
+        state = {
+            STORY: {story_id: set() for story_id in story_ids},
+            COMMENT: {comment_id: set() for comment_id in comment_ids}
+        }
+        if story_ids or comment_ids:
+            for kind, target_id, reaction_type in db.session.execute(
+                reaction_state_query(anonymous_id, story_ids, comment_ids)
+            ):
+                state[kind][target_id].add(reaction_type)
+        
+        # Apply changes still waiting in the write-behind buffer
+        for kind, ids in ((STORY, story_ids), (COMMENT, comment_ids)):
+            for (_, target_id, _, reaction_type), op in reaction_buffer.pending_for(kind, anonymous_id, ids).items():
+                if op == ADD:
+                    state[kind][target_id].add(reaction_type)
+                else:
+                    state[kind][target_id].discard(reaction_type)
+        
+        return jsonify({
+            'success': True,
+            'stories': {str(key): sorted(value) for key, value in state[STORY].items()},
+            'comments': {str(key): sorted(value) for key, value in state[COMMENT].items()},
+            'anonymous_id': anonymous_id
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @stories_bp.route('/reports', methods=['POST'])
 def create_report():
     """Report inappropriate content"""
@@ -385,38 +563,54 @@ def search_stories():
                 'error': 'Search query or hashtag is required'
             }), 400
         
-        # Build search query
-        search_query = Story.query.filter_by(is_approved=True, is_flagged=False)
+        clean_hashtag = normalize_hashtag(hashtag)
         
-        # Add text search
+        # Text queries go through the full-text index
         if query_text:
-            search_query = search_query.filter(
-                db.or_(
-                    Story.title.contains(query_text),
-                    Story.content.contains(query_text),
-                    Story.healing_process.contains(query_text),
-                    Story.next_steps.contains(query_text)
-                )
+            page = max(page, 1)
+            per_page = max(1, min(per_page, 100))
+            stories, snippets, total = search_story_index(
+                query_text,
+                category_id=category_id,
+                hashtag=clean_hashtag,
+                page=page,
+                per_page=per_page
             )
+            
+            results = []
+            for story in stories:
+                story_data = story.to_dict(include_content=False)
+                story_data['snippet'] = snippets.get(story.id)
+                results.append(story_data)
+            
+            pages = (total + per_page - 1) // per_page
+            return jsonify({
+                'success': True,
+                'query': query_text,
+                'hashtag': hashtag,
+                'stories': results,
+                'pagination': {
+                    'page': page,
+                    'per_page': per_page,
+                    'total': total,
+                    'pages': pages,
+                    'has_next': page < pages,
+                    'has_prev': page > 1
+                }
+            })
+        
+        # Build search query
+        search_query = Story.query.filter_by(is_approved=True, is_flagged=False)
         
         # Add hashtag search
-        if hashtag:
-            clean_hashtag = hashtag.strip().lstrip('#').lower()
-            search_query = search_query.filter(
-                Story.hashtags.contains(f'"{clean_hashtag}"')
-            )
+        search_query = search_query.join(StoryHashtag, StoryHashtag.story_id == Story.id).filter(
+            StoryHashtag.tag == clean_hashtag
+        )
         
         if category_id:
             search_query = search_query.filter_by(category_id=category_id)
         
-        # Order by relevance (stories with query in title first, then by date)
-        if query_text:
-            search_query = search_query.order_by(
-                Story.title.contains(query_text).desc(),
-                Story.created_at.desc()
-            )
-        else:
-            search_query = search_query.order_by(Story.created_at.desc())
+        search_query = search_query.order_by(StoryHashtag.created_at.desc())
         
         # Pagination
         results = search_query.paginate(
@@ -449,41 +643,31 @@ def search_stories():
 
 
 @stories_bp.route('/hashtags/trending', methods=['GET'])
+@cached('trending_hashtags', ttl=60, tags=['trending'])
 def get_trending_hashtags():
     """Get trending hashtags based on recent usage"""
     try:
-        import json
-        from collections import Counter
+        window = request.args.get('window', trending.DEFAULT_WINDOW)  # 24h, 7d, 30d
+        decay = request.args.get('decay', 0, type=float)  # Half-life in hours, 0 for none
+        limit = request.args.get('limit', 20, type=int)
         
-        # Get stories from the last 30 days
-        from datetime import datetime, timedelta
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+        if window not in trending.WINDOWS:
+            return jsonify({
+                'success': False,
+                'error': f"window must be one of {', '.join(trending.WINDOWS)}"
+            }), 400
         
-        recent_stories = Story.query.filter(
-            Story.created_at >= thirty_days_ago,
-            Story.is_approved == True,
-            Story.is_flagged == False,
-            Story.hashtags.isnot(None)
-        ).all()
-        
-        # Collect all hashtags
-        all_hashtags = []
-        for story in recent_stories:
-            if story.hashtags:
-                try:
-                    hashtags = json.loads(story.hashtags)
-                    all_hashtags.extend(hashtags)
-                except:
-                    continue
-        
-        # Count hashtag frequency
-        hashtag_counts = Counter(all_hashtags)
-        trending = [{'hashtag': tag, 'count': count} 
-                   for tag, count in hashtag_counts.most_common(20)]
+        # Served from the per-worker ranking built from hourly counters
+        hashtags = trending.get_trending_hashtags(
+            window=window,
+            half_life_hours=max(decay, 0),
+            limit=max(1, min(limit, trending.MAX_TRENDING))
+        )
         
         return jsonify({
             'success': True,
-            'trending_hashtags': trending
+            'window': window,
+            'trending_hashtags': hashtags
         })
         
     except Exception as e:
@@ -496,20 +680,50 @@ def get_trending_hashtags():
 def get_stories_by_hashtag(hashtag):
     """Get stories filtered by a specific hashtag"""
     try:
-        import json
-        
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         
         # Clean the hashtag
-        clean_hashtag = hashtag.strip().lstrip('#').lower()
+        clean_hashtag = normalize_hashtag(hashtag)
         
-        # Find stories containing this hashtag
-        stories = Story.query.filter(
+        # Range scan over the hashtag index, newest first
+        query = Story.query.join(StoryHashtag, StoryHashtag.story_id == Story.id).filter(
+            StoryHashtag.tag == clean_hashtag,
             Story.is_approved == True,
-            Story.is_flagged == False,
-            Story.hashtags.contains(f'"{clean_hashtag}"')
-        ).order_by(Story.created_at.desc()).paginate(
+            Story.is_flagged == False
+        )
+        
+        if 'cursor' in request.args:
+            per_page = max(1, min(per_page, 100))
+            try:
+                stories, next_cursor = keyset_paginate(
+                    query,
+                    [StoryHashtag.created_at, StoryHashtag.story_id],
+                    cursor=request.args.get('cursor'),
+                    limit=per_page,
+                    key=lambda story: (story.created_at, story.id)
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+            
+            return jsonify({
+                'success': True,
+                'hashtag': clean_hashtag,
+                'stories': [story.to_dict(include_content=False) for story in stories],
+                'pagination': {
+                    'per_page': per_page,
+                    'next_cursor': next_cursor,
+                    'has_next': next_cursor is not None
+                }
+            })
+        
+        stories = query.order_by(
+            StoryHashtag.created_at.desc(),
+            StoryHashtag.story_id.desc()
+        ).paginate(
             page=page,
             per_page=per_page,
             error_out=False
@@ -0,0 +1,2 @@
+# This file makes the services directory a Python package
+
@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+from src.models.story import Category
+
+# Categories change rarely, so each worker keeps a serialized snapshot of all of
+# them. Writes in this worker invalidate it immediately; the TTL bounds how long
+# other workers can serve a stale copy.
+SNAPSHOT_TTL = float(os.environ.get('CATEGORY_SNAPSHOT_TTL', 60))
+
+_lock = threading.Lock()
+_snapshot = None
+_loaded_at = 0.0
+
+def _load_snapshot():
+    """Build the category snapshot with a single query"""
+    return {category.id: category.to_dict() for category in Category.query.all()}
+
+def get_category_snapshot():
+    """Get serialized categories keyed by ID, rebuilding the snapshot if stale"""
+    global _snapshot, _loaded_at
+    
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - _loaded_at < SNAPSHOT_TTL:
+        return snapshot
+    
+    with _lock:
+        if _snapshot is None or time.monotonic() - _loaded_at >= SNAPSHOT_TTL:
+            _snapshot = _load_snapshot()
+            _loaded_at = time.monotonic()
+        return _snapshot
+
+def get_category_dict(category_id):
+    """Get the serialized form of a single category from the snapshot"""
+    category = get_category_snapshot().get(category_id)
+    if category is None and category_id is not None and time.monotonic() - _loaded_at > 1:
+        # Unknown ID: the category may have been created by another worker
+        invalidate_category_snapshot()
+        category = get_category_snapshot().get(category_id)
+    return category
+
+def invalidate_category_snapshot():
+    """Drop the snapshot so the next read rebuilds it"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
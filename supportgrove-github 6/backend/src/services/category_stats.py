@@ -0,0 +1,82 @@
+import logging
+from sqlalchemy import event, inspect
+from src.models.story import db, Category, Story
+from src.services.response_cache import invalidate_cache
+
+logger = logging.getLogger(__name__)
+
+def _previous_value(story, attribute):
+    """Get the value of an attribute as it was last loaded from the database"""
+    history = inspect(story).attrs[attribute].load_history()
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(story, attribute)
+
+def _is_listed(is_approved, is_flagged):
+    """Whether a story counts towards its category (column defaults apply to None)"""
+    return is_approved is not False and not is_flagged
+
+@event.listens_for(db.session, 'before_flush')
+def maintain_story_counts(session, flush_context, instances):
+    """Adjust Category.story_count in the same transaction as story changes"""
+    deltas = {}
+    
+    def add(category_id, delta):
+        if category_id is not None:
+            deltas[category_id] = deltas.get(category_id, 0) + delta
+    
+    for obj in session.new:
+        if isinstance(obj, Story) and _is_listed(obj.is_approved, obj.is_flagged):
+            add(obj.category_id, 1)
+    
+    for obj in session.deleted:
+        if isinstance(obj, Story) and _is_listed(
+            _previous_value(obj, 'is_approved'),
+            _previous_value(obj, 'is_flagged')
+        ):
+            add(_previous_value(obj, 'category_id'), -1)
+    
+    for obj in session.dirty:
+        if not isinstance(obj, Story) or obj in session.deleted:
+            continue
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if _is_listed(_previous_value(obj, 'is_approved'), _previous_value(obj, 'is_flagged')):
+            add(_previous_value(obj, 'category_id'), -1)
+        if _is_listed(obj.is_approved, obj.is_flagged):
+            add(obj.category_id, 1)
+    
+    categories = Category.__table__
+    for category_id, delta in deltas.items():
+        if delta:
+            session.execute(
+                categories.update()
+                .where(categories.c.id == category_id)
+                .values(story_count=db.func.coalesce(categories.c.story_count, 0) + delta)
+            )
+
+def reconcile_category_story_counts():
+    """Recompute story counts from the story table and repair any drift"""
+    actual = (
+        db.select(db.func.count(Story.id))
+        .where(
+            Story.category_id == Category.id,
+            Story.is_approved == True,
+            Story.is_flagged == False
+        )
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        db.update(Category)
+        .where(db.func.coalesce(Category.story_count, -1) != actual)
+        .values(story_count=actual)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    
+    if result.rowcount:
+        logger.warning('Repaired story_count drift for %d categories', result.rowcount)
+        invalidate_cache('categories')
+    return result.rowcount
@@ -0,0 +1,76 @@
+from src.models.story import db
+from src.models.comment import Comment, get_reaction_counts_for
+from src.utils.pagination import encode_cursor, keyset_paginate
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+DEFAULT_MAX_DEPTH = 2
+MAX_DEPTH = 10
+DEFAULT_REPLIES_LIMIT = 5
+MAX_REPLIES_LIMIT = 50
+
+THREAD_ORDER = [Comment.created_at, Comment.id]
+
+def _first_replies(parent_ids, replies_limit):
+    """Load the first ``replies_limit`` replies of each parent in one query"""
+    position = db.func.row_number().over(
+        partition_by=Comment.parent_comment_id,
+        order_by=(Comment.created_at, Comment.id)
+    ).label('position')
+    ranked = db.select(Comment.id, position).where(
+        Comment.parent_comment_id.in_(parent_ids),
+        Comment.is_deleted == False
+    ).subquery()
+    return Comment.query.join(ranked, ranked.c.id == Comment.id).filter(
+        ranked.c.position <= replies_limit
+    ).order_by(Comment.created_at.asc(), Comment.id.asc()).all()
+
+def _serialize(comment, children, reaction_counts):
+    replies = children.get(comment.id, [])
+    data = comment.to_dict({}, reaction_counts)
+    data['reply_count'] = comment.reply_count
+    data['replies'] = [_serialize(reply, children, reaction_counts) for reply in replies]
+    data['has_more_replies'] = comment.reply_count > len(replies)
+    # Continue after the last reply shown, or from the start when none were loaded
+    data['replies_cursor'] = encode_cursor(replies[-1].created_at, replies[-1].id) if replies else None
+    return data
+
+def build_thread_page(comments, max_depth, replies_limit):
+    """Serialize a page of comments with replies loaded breadth-first
+    
+    Costs one query per depth level plus one reaction aggregate, however many
+    comments are on the page. Nodes whose replies were cut off by
+    ``replies_limit`` or ``max_depth`` report ``has_more_replies`` and a
+    ``replies_cursor`` for GET /api/comments/<id>/replies.
+    """
+    children = {}
+    loaded = list(comments)
+    level = [comment for comment in comments if comment.reply_count]
+    for _ in range(max_depth):
+        if not level:
+            break
+        replies = _first_replies([comment.id for comment in level], replies_limit)
+        for reply in replies:
+            children.setdefault(reply.parent_comment_id, []).append(reply)
+        loaded.extend(replies)
+        level = [reply for reply in replies if reply.reply_count]
+    
+    reaction_counts = get_reaction_counts_for([comment.id for comment in loaded])
+    return [_serialize(comment, children, reaction_counts) for comment in comments]
+
+def get_thread_page(query, cursor, limit, max_depth, replies_limit):
+    """Seek to a page of ``query`` in thread order and serialize it
+    
+    Returns ``(comments, next_cursor)``; raises ValueError for a bad cursor.
+    """
+    comments, next_cursor = keyset_paginate(query, THREAD_ORDER, cursor=cursor, limit=limit, descending=False)
+    return build_thread_page(comments, max_depth, replies_limit), next_cursor
+
+def thread_page_args(args):
+    """Read and clamp the thread pagination query parameters"""
+    return {
+        'cursor': args.get('cursor'),
+        'limit': max(1, min(args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT)),
+        'max_depth': max(0, min(args.get('max_depth', DEFAULT_MAX_DEPTH, type=int), MAX_DEPTH)),
+        'replies_limit': max(1, min(args.get('replies_limit', DEFAULT_REPLIES_LIMIT, type=int), MAX_REPLIES_LIMIT))
+    }
@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from src.models.story import db, Story
+from src.models.comment import Comment, get_story_reaction_counts
+
+# Serialized story-plus-conversation payloads for shared links, keyed by story
+# and checked against story.conversation_version, which every comment, reply,
+# reaction and deletion bumps. The TTL bounds staleness from changes that do
+# not bump the version, such as moderation edits.
+SNAPSHOT_TTL = float(os.environ.get('SHARED_SNAPSHOT_TTL', 300))
+MAX_SNAPSHOTS = int(os.environ.get('SHARED_SNAPSHOT_CACHE_SIZE', 256))
+
+_lock = threading.Lock()
+_snapshots = OrderedDict()
+
+def build_conversation(story):
+    """Serialize a story with all of its comments using two queries"""
+    comments = Comment.query.filter_by(story_id=story.id).order_by(
+        Comment.created_at.asc(), Comment.id.asc()
+    ).all()
+    reaction_counts = get_story_reaction_counts(story.id)
+    
+    children = {}
+    for comment in comments:
+        children.setdefault(comment.parent_comment_id, []).append(comment)
+    
+    story_data = story.to_dict()
+    story_data['comments'] = []
+    for comment in children.get(None, []):
+        comment_data = comment.to_dict(children, reaction_counts)
+        # Shared views list every direct reply, including deleted ones
+        comment_data['replies'] = [reply.to_dict(children, reaction_counts) for reply in children.get(comment.id, [])]
+        story_data['comments'].append(comment_data)
+    return story_data
+
+def get_conversation_snapshot(story_id, version):
+    """Get the serialized conversation of a story at ``version``, building it on a miss"""
+    with _lock:
+        cached = _snapshots.get(story_id)
+        if cached and cached[0] == version and time.monotonic() - cached[1] < SNAPSHOT_TTL:
+            _snapshots.move_to_end(story_id)
+            return cached[2]
+    
+    story = db.session.get(Story, story_id)
+    story_data = build_conversation(story)
+    
+    with _lock:
+        _snapshots[story_id] = (version, time.monotonic(), story_data)
+        _snapshots.move_to_end(story_id)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return story_data
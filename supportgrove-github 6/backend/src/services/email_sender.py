@@ -0,0 +1,181 @@
+"""Background delivery of queued emails
+
+Requests only write rendered messages to ``email_outbox``. A singleton job
+sends due messages over pooled SMTP connections, retries failures with
+exponential backoff and records the outcome in ``ForwardedEmail.status``.
+
+Without ``SMTP_HOST`` messages are printed to the log instead, which is what
+the placeholder sender used to do. Point ``SMTP_HOST``/``SMTP_PORT`` at a
+local stand-in (e.g. ``python -m aiosmtpd -n -l localhost:1025``) to test
+real delivery.
+"""
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from src.models.story import db
+from src.models.sharing import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.environ.get('SMTP_HOST')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_USE_SSL = os.environ.get('SMTP_USE_SSL', 'false').lower() == 'true'
+SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 10))
+SMTP_FROM = os.environ.get('SMTP_FROM', 'SupportGrove <no-reply@supportgrove.online>')
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 2))
+SMTP_IDLE_TIMEOUT = float(os.environ.get('SMTP_IDLE_TIMEOUT', 60))
+
+BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 50))
+MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 5))
+RETRY_BASE_SECONDS = float(os.environ.get('EMAIL_RETRY_BASE_SECONDS', 30))
+RETRY_MAX_SECONDS = 3600
+
+class SMTPConnectionPool:
+    """Keeps logged-in SMTP connections open between sends"""
+    
+    def __init__(self, size=SMTP_POOL_SIZE, idle_timeout=SMTP_IDLE_TIMEOUT):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle = []  # (connection, released_at)
+    
+    @staticmethod
+    def _connect():
+        if SMTP_USE_SSL:
+            connection = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        else:
+            connection = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            if SMTP_USE_TLS:
+                connection.starttls()
+        if SMTP_USERNAME:
+            connection.login(SMTP_USERNAME, SMTP_PASSWORD or '')
+        return connection
+    
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+    
+    def acquire(self):
+        """Get a live connection, reusing an idle one when possible"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, released_at = self._idle.pop()
+            if time.monotonic() - released_at > self.idle_timeout:
+                self._close(connection)
+                continue
+            try:
+                if connection.noop()[0] == 250:
+                    return connection
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close(connection)
+        return self._connect()
+    
+    def release(self, connection):
+        """Return a healthy connection to the pool"""
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        self._close(connection)
+    
+    def discard(self, connection):
+        """Drop a connection after an error"""
+        self._close(connection)
+
+smtp_pool = SMTPConnectionPool()
+
+def build_message(entry):
+    """Build the MIME message for an outbox entry"""
+    message = MIMEMultipart('alternative')
+    message['Subject'] = entry.subject
+    message['From'] = SMTP_FROM
+    message['To'] = entry.recipient_email
+    if entry.text_content:
+        message.attach(MIMEText(entry.text_content, 'plain', 'utf-8'))
+    message.attach(MIMEText(entry.html_content, 'html', 'utf-8'))
+    return message
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, in seconds"""
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+def _mark(entry, status, error=None):
+    now = datetime.utcnow()
+    entry.status = status
+    entry.last_error = error
+    if status == 'sent':
+        entry.sent_at = now
+    if entry.forwarded_email is not None and status in ('sent', 'failed'):
+        entry.forwarded_email.status = status
+        if status == 'sent':
+            entry.forwarded_email.sent_at = now
+
+def _record_failure(entry, error):
+    entry.attempts += 1
+    if entry.attempts >= MAX_ATTEMPTS:
+        _mark(entry, 'failed', error)
+        logger.error('Giving up on email %s to %s: %s', entry.id, entry.recipient_email, error)
+    else:
+        entry.last_error = error
+        entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(entry.attempts))
+        logger.warning('Email %s to %s failed, retry %d scheduled: %s',
+                       entry.id, entry.recipient_email, entry.attempts, error)
+
+def _print_email(entry):
+    print(f"EMAIL SENT TO: {entry.recipient_email}")
+    print(f"SUBJECT: {entry.subject}")
+    print(f"CONTENT: {entry.html_content}")
+
+def send_queued_emails(batch_size=BATCH_SIZE):
+    """Send due outbox emails and return how many were delivered"""
+    entries = EmailOutbox.query.filter(
+        EmailOutbox.status == 'queued',
+        EmailOutbox.next_attempt_at <= datetime.utcnow()
+    ).order_by(EmailOutbox.next_attempt_at.asc()).limit(batch_size).all()
+    if not entries:
+        return 0
+    
+    delivered = 0
+    connection = None
+    try:
+        for entry in entries:
+            try:
+                if SMTP_HOST:
+                    if connection is None:
+                        connection = smtp_pool.acquire()
+                    connection.send_message(build_message(entry))
+                else:
+                    _print_email(entry)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                # The server rejected this message but the connection is still usable
+                _record_failure(entry, str(e))
+            except (smtplib.SMTPException, OSError) as e:
+                if connection is not None:
+                    smtp_pool.discard(connection)
+                    connection = None
+                _record_failure(entry, str(e))
+            else:
+                _mark(entry, 'sent')
+                delivered += 1
+            # Record each outcome right away so a crash resends as little as possible
+            db.session.commit()
+    finally:
+        if connection is not None:
+            smtp_pool.release(connection)
+    return delivered
@@ -0,0 +1,60 @@
+import json
+from src.models.story import db, Story, StoryHashtag
+
+MAX_HASHTAGS = 10
+MAX_HASHTAG_LENGTH = 50
+
+def normalize_hashtag(tag):
+    """Normalize a user-supplied hashtag (strip '#', lowercase)"""
+    return tag.strip().lstrip('#').lower()
+
+def clean_hashtags(hashtags):
+    """Normalize and limit a list of hashtags from a request payload"""
+    if not isinstance(hashtags, list):
+        return []
+    
+    cleaned = []
+    for tag in hashtags:
+        if isinstance(tag, str) and tag.strip():
+            tag = normalize_hashtag(tag)
+            if tag and len(tag) <= MAX_HASHTAG_LENGTH:
+                cleaned.append(tag)
+    return cleaned[:MAX_HASHTAGS]
+
+def index_story_hashtags(story, hashtags):
+    """Attach story_hashtags index rows for a story that is being created"""
+    story.hashtag_entries = [
+        StoryHashtag(tag=tag, created_at=story.created_at)
+        for tag in dict.fromkeys(hashtags)
+    ]
+
+def backfill_story_hashtags(batch_size=500):
+    """Rebuild missing story_hashtags rows from the Story.hashtags JSON"""
+    inserted = 0
+    last_id = 0
+    while True:
+        stories = (
+            Story.query
+            .filter(Story.id > last_id, Story.hashtags.isnot(None))
+            .order_by(Story.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not stories:
+            return inserted
+        
+        for story in stories:
+            try:
+                hashtags = json.loads(story.hashtags)
+            except ValueError:
+                continue
+            for tag in dict.fromkeys(tag for tag in hashtags if isinstance(tag, str)):
+                result = db.session.execute(
+                    db.insert(StoryHashtag)
+                    .prefix_with('OR IGNORE')
+                    .values(tag=tag, story_id=story.id, created_at=story.created_at)
+                )
+                inserted += result.rowcount
+        
+        db.session.commit()
+        last_id = stories[-1].id
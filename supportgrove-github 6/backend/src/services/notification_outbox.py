@@ -0,0 +1,230 @@
+"""Notification outbox
+
+Requests that should notify someone only insert a row into
+``notification_outbox`` in their own transaction. A background job turns the
+rows into notifications: it looks up stories and comments, builds the
+messages and writes notifications, counters and stream events, then deletes
+the rows in the same transaction.
+
+Delivery is at least once. A row is only removed when its notification is
+committed, and each notification carries a unique ``source_key`` derived from
+the outbox row, so processing a row twice still creates one notification.
+
+Activity on the same target (a story, or a comment) within
+``NOTIFICATION_COALESCE_WINDOW`` seconds is merged into the recipient's
+unread notification for it, e.g. "5 people reacted to your comment".
+"""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.story import db, Story
+from src.models.comment import Comment, Notification, NotificationActor, NotificationCounter, NotificationOutbox
+from src.services.notification_stream import publish_notification_event
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+REACTION_EMOJI = {'heart': '❤️', 'hug': '🤗', 'strength': '✨'}
+COALESCE_WINDOW = float(os.environ.get('NOTIFICATION_COALESCE_WINDOW', 86400))
+COALESCED_MESSAGES = {
+    'story_comment': "{count} people commented on your story '{title}'",
+    'comment_reply': "{count} people replied to your comment on '{title}'",
+    'comment_reaction': '{count} people reacted to your comment',
+}
+
+def enqueue_notification(notification_type, **payload):
+    """Queue a notification in the caller's transaction"""
+    db.session.add(NotificationOutbox(type=notification_type, payload=json.dumps(payload)))
+
+def notify_comment_reaction(comment, anonymous_id, reaction_type):
+    """Queue a notification for a comment's author about a new reaction"""
+    if comment.anonymous_id != anonymous_id:
+        enqueue_notification(
+            'comment_reaction',
+            comment_id=comment.id,
+            anonymous_id=anonymous_id,
+            reaction_type=reaction_type
+        )
+
+def _add_actor(notification_id, anonymous_id):
+    """Record who triggered a notification; returns 1 for a new person, else 0"""
+    return db.session.execute(
+        sqlite_insert(NotificationActor).values(
+            notification_id=notification_id,
+            anonymous_id=anonymous_id
+        ).on_conflict_do_nothing()
+    ).rowcount
+
+def _coalesce(recipient_id, notification_type, aggregate_key, story_title, comment_id, trigger_id):
+    """Merge activity into a recent unread notification for the same target
+    
+    Returns the merged notification's ID, or None when there is nothing to
+    merge into.
+    """
+    now = datetime.utcnow()
+    notification_id = db.session.execute(
+        db.select(Notification.id).where(
+            Notification.recipient_anonymous_id == recipient_id,
+            Notification.aggregate_key == aggregate_key,
+            Notification.is_read == False,
+            Notification.created_at >= now - timedelta(seconds=COALESCE_WINDOW)
+        ).order_by(Notification.created_at.desc()).limit(1)
+    ).scalar()
+    if notification_id is None:
+        return None
+    
+    new_actors = _add_actor(notification_id, trigger_id)
+    actor_count = db.session.execute(
+        db.update(Notification).where(Notification.id == notification_id).values(
+            actor_count=Notification.actor_count + new_actors,
+            comment_id=comment_id,
+            trigger_anonymous_id=trigger_id,
+            created_at=now
+        ).returning(Notification.actor_count).execution_options(synchronize_session=False)
+    ).scalar()
+    if actor_count > 1:
+        db.session.execute(
+            db.update(Notification).where(Notification.id == notification_id).values(
+                message=COALESCED_MESSAGES[notification_type].format(count=actor_count, title=story_title)
+            ).execution_options(synchronize_session=False)
+        )
+    return notification_id
+
+def create_notification(source_key, recipient_id, notification_type, story_id=None, comment_id=None, trigger_id=None,
+                        message=None, aggregate_key=None, story_title=None):
+    """Create a notification for a user unless one exists for ``source_key``
+    
+    With an ``aggregate_key``, the activity is merged into a recent unread
+    notification for the same target when there is one.
+    """
+    # Don't create self-notifications
+    if recipient_id == trigger_id:
+        return None
+    
+    if aggregate_key:
+        if db.session.execute(
+            db.select(Notification.id).where(Notification.source_key == source_key)
+        ).first():
+            return None  # Delivered by an earlier attempt
+        notification_id = _coalesce(recipient_id, notification_type, aggregate_key, story_title, comment_id, trigger_id)
+        if notification_id is not None:
+            publish_notification_event(recipient_id, 'notification', notification_id)
+            return notification_id
+    
+    notification_id = db.session.execute(
+        sqlite_insert(Notification).values(
+            recipient_anonymous_id=recipient_id,
+            type=notification_type,
+            story_id=story_id,
+            comment_id=comment_id,
+            trigger_anonymous_id=trigger_id,
+            message=message,
+            source_key=source_key,
+            aggregate_key=aggregate_key,
+            actor_count=1
+        ).on_conflict_do_nothing(index_elements=['source_key']).returning(Notification.id)
+    ).scalar()
+    if notification_id is None:
+        return None  # Delivered by an earlier attempt
+    
+    _add_actor(notification_id, trigger_id)
+    NotificationCounter.adjust(recipient_id, unread_delta=1, total_delta=1)
+    publish_notification_event(recipient_id, 'notification', notification_id)
+    return notification_id
+
+def build_notification(notification_type, payload):
+    """Get create_notification arguments for an outbox entry, or None if its content is gone"""
+    comment = db.session.get(Comment, payload['comment_id'])
+    story = db.session.get(Story, comment.story_id) if comment else None
+    if story is None:
+        return None
+    
+    if notification_type == 'story_comment':
+        return {
+            'recipient_id': story.anonymous_id,
+            'story_id': story.id,
+            'comment_id': comment.id,
+            'trigger_id': comment.anonymous_id,
+            'message': f"Someone commented on your story '{story.title}'",
+            'aggregate_key': f'story_comment:{story.id}',
+            'story_title': story.title
+        }
+    
+    if notification_type == 'comment_reply':
+        parent_comment = db.session.get(Comment, comment.parent_comment_id) if comment.parent_comment_id else None
+        if parent_comment is None:
+            return None
+        return {
+            'recipient_id': parent_comment.anonymous_id,
+            'story_id': comment.story_id,
+            'comment_id': comment.id,
+            'trigger_id': comment.anonymous_id,
+            'message': f"Someone replied to your comment on '{story.title}'",
+            'aggregate_key': f'comment_reply:{parent_comment.id}',
+            'story_title': story.title
+        }
+    
+    if notification_type == 'comment_reaction':
+        return {
+            'recipient_id': comment.anonymous_id,
+            'story_id': comment.story_id,
+            'comment_id': comment.id,
+            'trigger_id': payload['anonymous_id'],
+            'message': f"Someone reacted to your comment with {REACTION_EMOJI[payload['reaction_type']]}",
+            'aggregate_key': f'comment_reaction:{comment.id}',
+            'story_title': story.title
+        }
+    
+    raise ValueError(f'Unknown notification type {notification_type}')
+
+def _deliver(entry):
+    fields = build_notification(entry.type, json.loads(entry.payload))
+    if fields:
+        create_notification(f'outbox:{entry.id}', notification_type=entry.type, **fields)
+    db.session.delete(entry)
+
+def process_notification_outbox(batch_size=BATCH_SIZE):
+    """Turn queued outbox entries into notifications and return how many were delivered
+    
+    Each batch is committed as one transaction. If the batch fails, its entries
+    are retried one transaction each so a bad entry cannot hold back the rest;
+    entries failing MAX_ATTEMPTS times are left in the table for inspection.
+    """
+    delivered = 0
+    while True:
+        entries = NotificationOutbox.query.filter(
+            NotificationOutbox.attempts < MAX_ATTEMPTS
+        ).order_by(NotificationOutbox.id.asc()).limit(batch_size).all()
+        if not entries:
+            return delivered
+        entry_ids = [entry.id for entry in entries]
+        
+        try:
+            for entry in entries:
+                _deliver(entry)
+            db.session.commit()
+            delivered += len(entries)
+        except Exception:
+            db.session.rollback()
+            for entry_id in entry_ids:
+                entry = db.session.get(NotificationOutbox, entry_id)
+                if entry is None:
+                    continue
+                try:
+                    _deliver(entry)
+                    db.session.commit()
+                    delivered += 1
+                except Exception as e:
+                    db.session.rollback()
+                    logger.exception('Failed to deliver notification outbox entry %s', entry_id)
+                    NotificationOutbox.query.filter_by(id=entry_id).update({
+                        'attempts': NotificationOutbox.attempts + 1,
+                        'last_error': str(e)
+                    })
+                    db.session.commit()
+        
+        if len(entries) < batch_size:
+            return delivered
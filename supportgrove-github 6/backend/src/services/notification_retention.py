@@ -0,0 +1,80 @@
+"""Scheduled notification retention
+
+Old notifications are deleted in small batches found through the
+``(type, created_at)`` index, committing and pausing between batches so the
+SQLite write lock is only ever held briefly. Retention is configured in days
+with ``NOTIFICATION_RETENTION_DAYS`` and can be overridden per type, e.g.
+``NOTIFICATION_RETENTION_DAYS_COMMENT_REACTION=7``.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from src.models.story import db
+from src.models.comment import Notification, NotificationActor, NotificationCounter
+from src.services.notification_stream import publish_notification_event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = float(os.environ.get('NOTIFICATION_RETENTION_DAYS', 30))
+BATCH_SIZE = int(os.environ.get('NOTIFICATION_RETENTION_BATCH', 500))
+BATCH_PAUSE = float(os.environ.get('NOTIFICATION_RETENTION_PAUSE', 0.05))
+
+def retention_days(notification_type):
+    """Get the retention period in days for a notification type"""
+    value = os.environ.get(f'NOTIFICATION_RETENTION_DAYS_{notification_type.upper()}')
+    return float(value) if value else DEFAULT_RETENTION_DAYS
+
+def _delete_batch(notification_type, cutoff, batch_size):
+    """Delete one batch of expired notifications and keep counters in step"""
+    batch = (
+        db.select(Notification.id)
+        .where(Notification.type == notification_type, Notification.created_at < cutoff)
+        .order_by(Notification.created_at.asc())
+        .limit(batch_size)
+    )
+    # RETURNING reports the read state at deletion time, so counters stay exact
+    rows = db.session.execute(
+        db.delete(Notification).where(Notification.id.in_(batch))
+        .returning(Notification.id, Notification.recipient_anonymous_id, Notification.is_read)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not rows:
+        db.session.commit()
+        return 0
+    
+    ids = [row.id for row in rows]
+    removed = {}
+    for row in rows:
+        total, unread = removed.get(row.recipient_anonymous_id, (0, 0))
+        removed[row.recipient_anonymous_id] = (total + 1, unread + (0 if row.is_read else 1))
+    
+    NotificationActor.query.filter(NotificationActor.notification_id.in_(ids)).delete(synchronize_session=False)
+    for recipient_id, (total, unread) in removed.items():
+        NotificationCounter.adjust(recipient_id, unread_delta=-unread, total_delta=-total)
+        if unread:
+            publish_notification_event(recipient_id, 'deleted')
+    db.session.commit()
+    return len(ids)
+
+def prune_old_notifications(batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Delete notifications past their retention period; returns rows removed per type"""
+    started = time.monotonic()
+    now = datetime.utcnow()
+    deleted = {}
+    notification_types = [row[0] for row in db.session.query(Notification.type).distinct()]
+    for notification_type in notification_types:
+        cutoff = now - timedelta(days=retention_days(notification_type))
+        deleted[notification_type] = 0
+        while True:
+            count = _delete_batch(notification_type, cutoff, batch_size)
+            deleted[notification_type] += count
+            if count < batch_size:
+                break
+            time.sleep(pause)
+    
+    logger.info(
+        'Notification retention removed %d notifications %s in %.2fs',
+        sum(deleted.values()), deleted, time.monotonic() - started
+    )
+    return deleted
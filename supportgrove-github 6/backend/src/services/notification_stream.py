@@ -0,0 +1,210 @@
+"""Server-Sent Events for notifications
+
+Every notification change is recorded in ``notification_events`` in the same
+transaction as the change. Each worker runs one dispatcher thread that polls
+that table and hands new events to the streams open in the worker, so a
+notification created by any worker reaches streams held by all of them.
+Event IDs double as SSE IDs, which lets a reconnecting client resume with
+``Last-Event-ID``.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from src.models.story import db
+from src.models.comment import Notification, NotificationCounter, NotificationEvent, get_story_titles
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.environ.get('NOTIFICATION_STREAM_POLL_INTERVAL', 1))
+HEARTBEAT_INTERVAL = float(os.environ.get('NOTIFICATION_STREAM_HEARTBEAT', 15))
+MAX_CONNECTIONS = int(os.environ.get('NOTIFICATION_STREAM_MAX_CONNECTIONS', 48))
+EVENT_RETENTION = float(os.environ.get('NOTIFICATION_EVENT_RETENTION', 3600))
+RETRY_MS = 5000
+MAX_REPLAY = 100
+MAX_QUEUED = 100
+POLL_BATCH = 500
+
+def publish_notification_event(recipient_id, event_type, notification_id=None):
+    """Record a notification change in the caller's transaction"""
+    db.session.add(NotificationEvent(
+        recipient_anonymous_id=recipient_id,
+        event_type=event_type,
+        notification_id=notification_id
+    ))
+
+def get_unread_count(recipient_id):
+    return NotificationCounter.get_counts(recipient_id)[0]
+
+def prune_notification_events():
+    """Delete events older than the resume window"""
+    cutoff = datetime.utcnow() - timedelta(seconds=EVENT_RETENTION)
+    deleted = NotificationEvent.query.filter(NotificationEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def format_event(event_id, name, data):
+    """Serialize one event in the text/event-stream format"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {name}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def build_events(events):
+    """Turn stored events into (recipient, (id, name, data)) pairs for streaming"""
+    notification_ids = {event.notification_id for event in events if event.event_type == 'notification'}
+    notifications = {}
+    if notification_ids:
+        rows = Notification.query.filter(Notification.id.in_(notification_ids)).all()
+        story_titles = get_story_titles(notification.story_id for notification in rows)
+        notifications = {notification.id: notification.to_dict(story_titles) for notification in rows}
+    
+    unread_counts = {}
+    built = []
+    for event in events:
+        recipient_id = event.recipient_anonymous_id
+        if recipient_id not in unread_counts:
+            unread_counts[recipient_id] = get_unread_count(recipient_id)
+        data = {'unread_count': unread_counts[recipient_id], 'notification_id': event.notification_id}
+        if event.event_type == 'notification':
+            if event.notification_id not in notifications:
+                continue  # Deleted before it was delivered
+            data['notification'] = notifications[event.notification_id]
+        built.append((recipient_id, (event.id, event.event_type, data)))
+    return built
+
+class Subscriber:
+    def __init__(self, recipient_id):
+        self.recipient_id = recipient_id
+        self.queue = queue.Queue(maxsize=MAX_QUEUED)
+        self.closed = threading.Event()
+
+class NotificationHub:
+    """Per-worker registry of open streams and the dispatcher feeding them"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._connections = 0
+        self._thread = None
+        self._last_id = None
+    
+    def subscribe(self, app, recipient_id):
+        """Register a stream, or return None if this worker has no capacity left"""
+        with self._lock:
+            if self._connections >= MAX_CONNECTIONS:
+                return None
+            subscriber = Subscriber(recipient_id)
+            self._subscribers.setdefault(recipient_id, set()).add(subscriber)
+            self._connections += 1
+            if self._thread is None:
+                self._last_id = self.latest_event_id()
+                self._thread = threading.Thread(
+                    target=self._run, args=(app,), name='notification-dispatcher', daemon=True
+                )
+                self._thread.start()
+            return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.recipient_id)
+            if subscribers and subscriber in subscribers:
+                subscribers.discard(subscriber)
+                self._connections -= 1
+                if not subscribers:
+                    del self._subscribers[subscriber.recipient_id]
+    
+    @staticmethod
+    def latest_event_id():
+        return db.session.query(db.func.max(NotificationEvent.id)).scalar() or 0
+    
+    def initial_events(self, recipient_id, last_event_id):
+        """Get the events a new stream starts with
+        
+        A fresh stream gets the current unread count. A resumed stream gets
+        the events it missed, or a 'resync' event when they are no longer
+        retained and the client has to refetch the notification list.
+        """
+        latest_id = self.latest_event_id()
+        if last_event_id is None or last_event_id > latest_id:
+            return [(latest_id, 'unread_count', {'unread_count': get_unread_count(recipient_id)})]
+        
+        oldest_id = db.session.query(db.func.min(NotificationEvent.id)).scalar()
+        events = NotificationEvent.query.filter(
+            NotificationEvent.recipient_anonymous_id == recipient_id,
+            NotificationEvent.id > last_event_id
+        ).order_by(NotificationEvent.id.asc()).limit(MAX_REPLAY + 1).all()
+        
+        if len(events) > MAX_REPLAY or (oldest_id is not None and oldest_id > last_event_id + 1):
+            return [(latest_id, 'resync', {'unread_count': get_unread_count(recipient_id)})]
+        return [event for _, event in build_events(events)]
+    
+    def _run(self, app):
+        while True:
+            time.sleep(POLL_INTERVAL)
+            if not self._connections:
+                continue
+            with app.app_context():
+                try:
+                    self.dispatch()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Notification dispatch failed')
+                finally:
+                    db.session.remove()
+    
+    def dispatch(self):
+        """Deliver events written since the last poll to the streams in this worker"""
+        while True:
+            events = NotificationEvent.query.filter(
+                NotificationEvent.id > self._last_id
+            ).order_by(NotificationEvent.id.asc()).limit(POLL_BATCH).all()
+            if not events:
+                return
+            self._last_id = events[-1].id
+            batch_size = len(events)
+            
+            with self._lock:
+                listening = set(self._subscribers)
+            events = [event for event in events if event.recipient_anonymous_id in listening]
+            for recipient_id, event in build_events(events):
+                with self._lock:
+                    subscribers = list(self._subscribers.get(recipient_id, ()))
+                for subscriber in subscribers:
+                    try:
+                        subscriber.queue.put_nowait(event)
+                    except queue.Full:
+                        # The client is not keeping up; it resumes from its last ID
+                        subscriber.closed.set()
+            
+            if batch_size < POLL_BATCH:
+                return
+    
+    def stream(self, subscriber, initial):
+        """Generate the text/event-stream body for one subscriber"""
+        last_id = 0
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            for event_id, name, data in initial:
+                last_id = max(last_id, event_id)
+                yield format_event(event_id, name, data)
+            
+            while not subscriber.closed.is_set():
+                try:
+                    event_id, name, data = subscriber.queue.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+                    continue
+                if event_id <= last_id:
+                    continue  # Already sent while replaying
+                last_id = event_id
+                yield format_event(event_id, name, data)
+        finally:
+            self.unsubscribe(subscriber)
+
+notification_hub = NotificationHub()
@@ -0,0 +1,287 @@
+"""Optional write-behind buffer for story and comment reactions
+
+With ``REACTION_WRITE_BEHIND`` enabled, reaction requests only perform reads
+and append the change to a per-worker journal file. A background job
+replays the journal into the database every ``REACTION_FLUSH_INTERVAL_MS``
+in one transaction.
+
+The journal is the durable queue. Replaying it is idempotent, because
+inserts use ON CONFLICT DO NOTHING and counters only move for rows that
+actually changed. A flush that fails, or a worker that dies, leaves its
+file behind for a later flush or for the next worker that starts.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert
+from src.models.story import db, Story, Reaction
+from src.models.comment import Comment, CommentReaction
+from src.services.notification_outbox import enqueue_notification
+from src.services.response_cache import invalidate_cache
+
+logger = logging.getLogger(__name__)
+
+STORY = 'story'
+COMMENT = 'comment'
+ADD = 'add'
+REMOVE = 'remove'
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'reaction_journal')
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+class ReactionBuffer:
+    def __init__(self):
+        self.enabled = False
+        self.journal_dir = None
+        self.fsync = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._journal = None
+        self._journal_path = None
+        # (kind, target_id, anonymous_id, reaction_type) -> latest op not yet flushed
+        self._pending = {}
+        # (kind, target_id) -> {reaction_type: delta}
+        self._deltas = {}
+        # Rotated journal path -> (pending, deltas) it holds, until its flush commits
+        self._in_flight = {}
+    
+    def configure(self, journal_dir, fsync=False):
+        """Enable the buffer and claim journals left behind by dead workers"""
+        self.enabled = True
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        os.makedirs(journal_dir, exist_ok=True)
+        self._claim_orphaned_journals()
+    
+    def _new_journal_path(self, suffix):
+        return os.path.join(self.journal_dir, f'{os.getpid()}-{uuid.uuid4().hex}.{suffix}')
+    
+    def _claim_orphaned_journals(self):
+        for path in glob.glob(os.path.join(self.journal_dir, '*-*.*')):
+            try:
+                pid = int(os.path.basename(path).split('-', 1)[0])
+            except ValueError:
+                continue
+            if pid == os.getpid() or _pid_alive(pid):
+                continue
+            try:
+                os.rename(path, self._new_journal_path('flushing'))
+            except OSError:
+                pass  # Claimed by another worker first
+    
+    def _write(self, entry):
+        if self._journal is None:
+            self._journal_path = self._new_journal_path('log')
+            self._journal = open(self._journal_path, 'a', encoding='utf-8')
+        self._journal.write(json.dumps(entry) + '\n')
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+    
+    def _layers(self):
+        """Unflushed (pending, deltas) layers, oldest first; call with the lock held"""
+        return [*self._in_flight.values(), (self._pending, self._deltas)]
+    
+    def _latest_op(self, key):
+        """Newest unflushed op for a reaction, if any; call with the lock held
+        
+        Each layer records ops relative to the ones below it, so a key missing
+        from a newer layer (an add and remove that cancelled) falls through.
+        """
+        for pending, _ in reversed(self._layers()):
+            if key in pending:
+                return pending[key]
+        return None
+    
+    def pending_deltas(self, kind, target_id):
+        """Get unflushed count changes per reaction type for a story or comment"""
+        totals = {}
+        with self._lock:
+            for _, deltas in self._layers():
+                for reaction_type, delta in deltas.get((kind, target_id), {}).items():
+                    totals[reaction_type] = totals.get(reaction_type, 0) + delta
+        return totals
+    
+    def pending_for(self, kind, anonymous_id, target_ids):
+        """Get unflushed ops of one user for a set of targets"""
+        target_ids = set(target_ids)
+        ops = {}
+        with self._lock:
+            for pending, _ in self._layers():
+                ops.update(
+                    (key, op) for key, op in pending.items()
+                    if key[0] == kind and key[2] == anonymous_id and key[1] in target_ids
+                )
+        return ops
+    
+    def submit(self, kind, target_id, anonymous_id, reaction_type, op, stored):
+        """Check and durably queue a reaction change in one step
+        
+        ``op`` is ADD, REMOVE or None to toggle. ``stored`` is a function telling
+        whether the reaction is in the database; it is only called when no change
+        is pending. Returns the queued op, or None if the change would do nothing,
+        such as a second identical add from a double click.
+        """
+        key = (kind, target_id, anonymous_id, reaction_type)
+        with self._lock:
+            # Checked under the lock so concurrent requests see each other's ops
+            latest = self._latest_op(key)
+            exists = latest == ADD if latest else stored()
+            if op is None:
+                op = REMOVE if exists else ADD
+            elif (op == ADD) == exists:
+                return None
+            
+            self._write({
+                'kind': kind,
+                'target_id': target_id,
+                'anonymous_id': anonymous_id,
+                'reaction_type': reaction_type,
+                'op': op,
+                'at': datetime.utcnow().isoformat()
+            })
+            
+            # Here a pending op is always the opposite one, and the two cancel out
+            if key in self._pending:
+                del self._pending[key]
+            else:
+                self._pending[key] = op
+            
+            deltas = self._deltas.setdefault((kind, target_id), {})
+            deltas[reaction_type] = deltas.get(reaction_type, 0) + (1 if op == ADD else -1)
+        return op
+    
+    def flush(self):
+        """Rotate the journal and apply every journal awaiting flush"""
+        if not self.enabled:
+            return 0
+        
+        with self._flush_lock:
+            with self._lock:
+                if self._journal is not None:
+                    self._journal.close()
+                    flushing_path = self._new_journal_path('flushing')
+                    os.rename(self._journal_path, flushing_path)
+                    self._journal = None
+                    # Still visible to requests until committed; kept for the retry if the flush fails
+                    self._in_flight[flushing_path] = (self._pending, self._deltas)
+                    self._pending = {}
+                    self._deltas = {}
+            
+            mine = sorted(glob.glob(os.path.join(self.journal_dir, f'{os.getpid()}-*.flushing')), key=os.path.getmtime)
+            applied = 0
+            for path in mine:
+                try:
+                    applied += self._apply_journal(path)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Failed to flush reaction journal %s; will retry', path)
+                    break
+                with self._lock:
+                    self._in_flight.pop(path, None)
+                os.remove(path)
+            return applied
+    
+    def _apply_journal(self, path):
+        """Replay one journal file in a single transaction"""
+        latest = {}
+        with open(path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Torn final line from a crash
+                key = (entry['kind'], entry['target_id'], entry['anonymous_id'], entry['reaction_type'])
+                latest[key] = entry
+        
+        story_deltas = {}
+        changed_comment_ids = set()
+        new_comment_reactions = []
+        for (kind, target_id, anonymous_id, reaction_type), entry in latest.items():
+            if kind == STORY:
+                changed = self._apply_story_reaction(entry)
+                if changed:
+                    deltas = story_deltas.setdefault(target_id, {})
+                    deltas[reaction_type] = deltas.get(reaction_type, 0) + changed
+            else:
+                changed = self._apply_comment_reaction(entry)
+                if changed:
+                    changed_comment_ids.add(target_id)
+                if changed > 0:
+                    new_comment_reactions.append(entry)
+        
+        for story_id, deltas in story_deltas.items():
+            for reaction_type, delta in deltas.items():
+                if delta and reaction_type in Story.REACTION_COUNTERS:
+                    Story.adjust_counter(story_id, Story.REACTION_COUNTERS[reaction_type], delta)
+        
+        comment_story_ids = []
+        if changed_comment_ids:
+            comment_story_ids = [row[0] for row in db.session.query(Comment.story_id).filter(
+                Comment.id.in_(changed_comment_ids)
+            ).distinct()]
+            Story.bump_conversation_version(*comment_story_ids)
+        
+        for entry in new_comment_reactions:
+            enqueue_notification(
+                'comment_reaction',
+                comment_id=entry['target_id'],
+                anonymous_id=entry['anonymous_id'],
+                reaction_type=entry['reaction_type']
+            )
+        
+        db.session.commit()
+        invalidate_cache(
+            *[f'story:{story_id}' for story_id in story_deltas],
+            *[f'comments:{story_id}' for story_id in comment_story_ids]
+        )
+        return len(latest)
+    
+    @staticmethod
+    def _apply_story_reaction(entry):
+        """Make the stored state match the entry; returns the row count change"""
+        if entry['op'] == ADD:
+            return db.session.execute(
+                insert(Reaction).values(
+                    story_id=entry['target_id'],
+                    reaction_type=entry['reaction_type'],
+                    anonymous_id=entry['anonymous_id'],
+                    created_at=datetime.fromisoformat(entry['at'])
+                ).on_conflict_do_nothing(index_elements=['story_id', 'anonymous_id', 'reaction_type'])
+            ).rowcount
+        return -Reaction.query.filter_by(
+            story_id=entry['target_id'],
+            anonymous_id=entry['anonymous_id'],
+            reaction_type=entry['reaction_type']
+        ).delete(synchronize_session=False)
+    
+    @staticmethod
+    def _apply_comment_reaction(entry):
+        if entry['op'] == ADD:
+            return db.session.execute(
+                insert(CommentReaction).values(
+                    comment_id=entry['target_id'],
+                    reaction_type=entry['reaction_type'],
+                    anonymous_id=entry['anonymous_id'],
+                    created_at=datetime.fromisoformat(entry['at'])
+                ).on_conflict_do_nothing(index_elements=['comment_id', 'anonymous_id', 'reaction_type'])
+            ).rowcount
+        return -CommentReaction.query.filter_by(
+            comment_id=entry['target_id'],
+            anonymous_id=entry['anonymous_id'],
+            reaction_type=entry['reaction_type']
+        ).delete(synchronize_session=False)
+
+reaction_buffer = ReactionBuffer()
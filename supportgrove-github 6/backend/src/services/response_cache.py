@@ -0,0 +1,299 @@
+"""Response cache for read-heavy endpoints
+
+Routes opt in with the ``cached`` decorator, which stores successful JSON
+responses under the request path and query string for ``ttl`` seconds. Each
+entry carries tags such as ``story:12`` or ``categories``; writes call
+``invalidate_cache`` with the tags they affect after committing.
+
+Backends are chosen with ``RESPONSE_CACHE_BACKEND``:
+
+- ``sqlite`` (default): a local SQLite file shared by every worker on the
+  host (``RESPONSE_CACHE_PATH``), so hits and invalidations are shared and a
+  client that posts a comment or reaction sees it on its next read, whichever
+  worker serves it.
+- ``memory``: an LRU per worker process. Invalidations only reach the worker
+  that made the change, other workers serve stale responses until the TTL
+  expires, so use it only with a single worker.
+- ``none``: caching disabled.
+
+Every tag also has a version that invalidation bumps. A response is only
+stored if none of its tags changed while it was being built, so a slow
+request cannot put back data that a concurrent write just invalidated.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, make_response
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'sqlite').lower()
+DEFAULT_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 30))
+MEMORY_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+# One file per database by default, so processes on different databases never share entries
+SQLITE_PATH = os.environ.get('RESPONSE_CACHE_PATH') or os.path.join(
+    tempfile.gettempdir(),
+    f"supportgrove-response-cache-{hashlib.sha1(os.environ.get('DATABASE_URL', '').encode()).hexdigest()[:12]}.db"
+)
+PURGE_EVERY = 200  # SQLite backend: drop expired entries every N stores
+
+class MemoryBackend:
+    """In-process LRU of cached responses"""
+    name = 'memory'
+    
+    def __init__(self, size=MEMORY_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tag_keys = {}
+        self._versions = {}
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def tag_versions(self, tags):
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+    
+    def set(self, key, value, ttl, tags, versions):
+        """Store a response unless one of its tags was invalidated since ``versions``"""
+        with self._lock:
+            if [self._versions.get(tag, 0) for tag in tags] != versions:
+                return False
+            self._remove(key)
+            self._entries[key] = (time.time() + ttl, value, tags)
+            for tag in tags:
+                self._tag_keys.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.size:
+                self._remove(next(iter(self._entries)))
+            return True
+    
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                for key in list(self._tag_keys.get(tag, ())):
+                    self._remove(key)
+    
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+    
+    def entry_count(self):
+        return len(self._entries)
+
+class SQLiteBackend:
+    """Cached responses in a SQLite file shared by all workers on the host"""
+    name = 'sqlite'
+    
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS ix_entries_expires_at ON entries (expires_at)',
+        'CREATE TABLE IF NOT EXISTS entry_tags (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key)) WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS ix_entry_tags_key ON entry_tags (key)',
+        'CREATE TABLE IF NOT EXISTS tag_versions (tag TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID',
+    ]
+    
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._stores = 0
+        # Not kept: connections are opened per thread, after gunicorn forks
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+        finally:
+            connection.close()
+    
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Autocommit mode; writes open their own IMMEDIATE transactions
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA synchronous=OFF')  # Losing cache entries on a crash is harmless
+            self._local.connection = connection
+        return connection
+    
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM entries WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return bytes(row[0]) if row else None
+    
+    def _versions(self, connection, tags):
+        placeholders = ','.join('?' * len(tags))
+        rows = dict(connection.execute(
+            f'SELECT tag, version FROM tag_versions WHERE tag IN ({placeholders})', tags
+        ).fetchall()) if tags else {}
+        return [rows.get(tag, 0) for tag in tags]
+    
+    def tag_versions(self, tags):
+        return self._versions(self._connection(), tags)
+    
+    def set(self, key, value, ttl, tags, versions):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if self._versions(connection, tags) != versions:
+                connection.execute('ROLLBACK')
+                return False
+            connection.execute(
+                'INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, time.time() + ttl)
+            )
+            connection.execute('DELETE FROM entry_tags WHERE key = ?', (key,))
+            connection.executemany('INSERT INTO entry_tags (tag, key) VALUES (?, ?)', [(tag, key) for tag in tags])
+            self._stores += 1
+            if self._stores % PURGE_EVERY == 0:
+                self._purge(connection)
+            connection.execute('COMMIT')
+            return True
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+    
+    @staticmethod
+    def _purge(connection):
+        connection.execute('DELETE FROM entries WHERE expires_at <= ?', (time.time(),))
+        connection.execute('DELETE FROM entry_tags WHERE key NOT IN (SELECT key FROM entries)')
+    
+    def invalidate(self, tags):
+        placeholders = ','.join('?' * len(tags))
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT INTO tag_versions (tag, version) VALUES (?, 1) '
+                'ON CONFLICT (tag) DO UPDATE SET version = version + 1',
+                [(tag,) for tag in tags]
+            )
+            connection.execute(
+                f'DELETE FROM entries WHERE key IN (SELECT key FROM entry_tags WHERE tag IN ({placeholders}))', tags
+            )
+            connection.execute(f'DELETE FROM entry_tags WHERE tag IN ({placeholders})', tags)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+    
+    def entry_count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+def create_backend(name):
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name == 'none':
+        return None
+    raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND {name!r}')
+
+class ResponseCache:
+    """Route decorator, invalidation and hit/miss counters over a backend"""
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats = {}
+    
+    def _count(self, name, field):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0})
+            stats[field] += 1
+    
+    @staticmethod
+    def request_key(name):
+        query = urlencode(sorted(request.args.items(multi=True)))
+        return f'{name}:{request.path}?{query}'
+    
+    def cached(self, name, ttl=DEFAULT_TTL, tags=None):
+        """Cache a GET route's successful JSON responses
+        
+        ``tags`` is a list of tags or a function taking the route's arguments
+        and returning one.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+                
+                key = self.request_key(name)
+                entry_tags = list(tags(**kwargs) if callable(tags) else tags or [])
+                try:
+                    body = self.backend.get(key)
+                    versions = self.backend.tag_versions(entry_tags) if body is None else None
+                except Exception:
+                    logger.exception('Response cache lookup failed for %s', key)
+                    self._count(name, 'errors')
+                    return view(*args, **kwargs)
+                
+                if body is not None:
+                    self._count(name, 'hits')
+                    response = make_response(body)
+                    response.mimetype = 'application/json'
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+                
+                self._count(name, 'misses')
+                response = make_response(view(*args, **kwargs))
+                response.headers['X-Cache'] = 'MISS'
+                if response.status_code == 200 and response.mimetype == 'application/json':
+                    try:
+                        if self.backend.set(key, response.get_data(), ttl, entry_tags, versions):
+                            self._count(name, 'stores')
+                    except Exception:
+                        logger.exception('Response cache store failed for %s', key)
+                        self._count(name, 'errors')
+                return response
+            return wrapper
+        return decorator
+    
+    def invalidate(self, *tags):
+        """Drop cached responses carrying any of ``tags``; call after committing"""
+        if self.backend is None or not tags:
+            return
+        try:
+            self.backend.invalidate(list(dict.fromkeys(tags)))
+        except Exception:
+            logger.exception('Response cache invalidation failed for %s', tags)
+    
+    def metrics(self):
+        with self._lock:
+            caches = {name: dict(stats) for name, stats in self._stats.items()}
+        for stats in caches.values():
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return {
+            'backend': self.backend.name if self.backend else 'none',
+            'entries': self.backend.entry_count() if self.backend else 0,
+            'caches': caches
+        }
+
+response_cache = ResponseCache(create_backend(BACKEND))
+cached = response_cache.cached
+invalidate_cache = response_cache.invalidate
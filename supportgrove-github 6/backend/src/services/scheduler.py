@@ -0,0 +1,75 @@
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from src.models.story import db
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_jobs = {}
+
+@contextmanager
+def job_lock(name):
+    """Hold a host-wide lock so only one worker process runs a job at a time
+    
+    Yields False when another process already holds the lock.
+    """
+    if fcntl is None:
+        yield True
+        return
+    
+    path = os.path.join(tempfile.gettempdir(), f'supportgrove-{name}.lock')
+    with open(path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def run_job(app, name, func, singleton=True):
+    """Run a job once inside an application context"""
+    with app.app_context():
+        try:
+            if singleton:
+                with job_lock(name) as acquired:
+                    if acquired:
+                        func()
+            else:
+                func()
+        except Exception:
+            db.session.rollback()
+            logger.exception('Background job %s failed', name)
+        finally:
+            db.session.remove()
+
+def run_periodically(app, name, interval, func, singleton=True):
+    """Run ``func`` every ``interval`` seconds on a daemon thread
+    
+    Jobs are started once per worker process. With ``singleton`` set, workers
+    on the same host skip a run while another worker is executing it.
+    Returns the stop event for the job, or None if it is disabled.
+    """
+    if interval <= 0 or os.environ.get('BACKGROUND_JOBS', 'true').lower() == 'false':
+        return None
+    if name in _jobs:
+        return _jobs[name]
+    
+    stop = threading.Event()
+    
+    def loop():
+        while not stop.wait(interval):
+            run_job(app, name, func, singleton=singleton)
+    
+    threading.Thread(target=loop, name=f'job-{name}', daemon=True).start()
+    _jobs[name] = stop
+    return stop
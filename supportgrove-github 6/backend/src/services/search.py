@@ -0,0 +1,87 @@
+import html
+import re
+from src.models.story import db, Story
+
+# Control characters cannot appear in stored text, so they are safe snippet
+# markers that survive HTML escaping and are then swapped for <mark> tags.
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+
+_TOKEN_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+_WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+def build_match_query(query_text):
+    """Translate user input into a safe FTS5 MATCH expression
+    
+    Quoted text becomes a phrase query, a trailing ``*`` makes a prefix query
+    and every other word must match. FTS5 operators typed by users are
+    treated as plain words. Returns None when nothing searchable remains.
+    """
+    terms = []
+    for match in _TOKEN_PATTERN.finditer(query_text):
+        phrase, word = match.groups()
+        if phrase is not None:
+            words = _WORD_PATTERN.findall(phrase)
+            if words:
+                terms.append('"' + ' '.join(words) + '"')
+            continue
+        
+        words = _WORD_PATTERN.findall(word)
+        if not words:
+            continue
+        if len(words) > 1:
+            # Punctuated words such as "self-care" match as a phrase
+            terms.append('"' + ' '.join(words) + '"' + ('*' if word.endswith('*') else ''))
+        elif word.endswith('*'):
+            terms.append(f'"{words[0]}"*')
+        else:
+            terms.append(f'"{words[0]}"')
+    
+    return ' AND '.join(terms) if terms else None
+
+def _highlight(snippet):
+    return html.escape(snippet).replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+
+def search_story_index(query_text, category_id=None, hashtag=None, page=1, per_page=10):
+    """Rank approved stories against the full-text index with BM25
+    
+    Returns ``(stories, snippets, total)`` where ``snippets`` maps story IDs
+    to an HTML-escaped excerpt with matches wrapped in ``<mark>`` tags.
+    """
+    match_query = build_match_query(query_text)
+    if match_query is None:
+        return [], {}, 0
+    
+    filters = ['story_fts MATCH :match', 'story.is_approved = 1', 'story.is_flagged = 0']
+    params = {'match': match_query}
+    if category_id:
+        filters.append('story.category_id = :category_id')
+        params['category_id'] = category_id
+    if hashtag:
+        filters.append('EXISTS (SELECT 1 FROM story_hashtags WHERE tag = :hashtag AND story_id = story.id)')
+        params['hashtag'] = hashtag
+    where = ' AND '.join(filters)
+    
+    total = db.session.execute(db.text(
+        f'SELECT COUNT(*) FROM story_fts JOIN story ON story.id = story_fts.rowid WHERE {where}'
+    ), params).scalar()
+    
+    rows = db.session.execute(db.text(f"""
+        SELECT story.id, snippet(story_fts, -1, :start, :end, '…', 24)
+        FROM story_fts JOIN story ON story.id = story_fts.rowid
+        WHERE {where}
+        ORDER BY story_fts.rank, story.created_at DESC
+        LIMIT :limit OFFSET :offset
+    """), dict(
+        params,
+        start=_MATCH_START,
+        end=_MATCH_END,
+        limit=per_page,
+        offset=(page - 1) * per_page
+    )).all()
+    
+    story_ids = [row[0] for row in rows]
+    stories_by_id = {story.id: story for story in Story.query.filter(Story.id.in_(story_ids))} if story_ids else {}
+    stories = [stories_by_id[story_id] for story_id in story_ids if story_id in stories_by_id]
+    snippets = {row[0]: _highlight(row[1]) for row in rows}
+    return stories, snippets, total
@@ -0,0 +1,58 @@
+"""Scheduled archiving of expired shared links
+
+Expired links are found through the ``expires_at`` index and moved to
+``archived_shared_conversations`` in small batches, committing and pausing
+between batches like notification retention does. Archived links answer with
+410 Gone, and their share IDs stay in the share ID filter so they are never
+issued again.
+"""
+import logging
+import os
+import time
+from datetime import datetime
+from src.models.story import db
+from src.models.sharing import SharedConversation, ArchivedSharedConversation
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get('SHARE_ARCHIVE_BATCH', 500))
+BATCH_PAUSE = float(os.environ.get('SHARE_ARCHIVE_PAUSE', 0.05))
+
+ARCHIVED_COLUMNS = ['id', 'story_id', 'share_id', 'shared_by', 'personal_message', 'created_at', 'expires_at', 'view_count']
+
+def _archive_batch(cutoff, batch_size):
+    """Move one batch of expired links to the archive table"""
+    live = SharedConversation.__table__
+    archive = ArchivedSharedConversation.__table__
+    newest_id = db.select(db.func.max(live.c.id)).scalar_subquery()
+    batch_ids = db.session.execute(
+        db.select(live.c.id)
+        .where(live.c.expires_at < cutoff, live.c.id < newest_id)  # Keep the newest row, see share_filter
+        .order_by(live.c.expires_at.asc())
+        .limit(batch_size)
+    ).scalars().all()
+    if not batch_ids:
+        return 0
+    
+    db.session.execute(archive.insert().from_select(
+        ARCHIVED_COLUMNS + ['archived_at'],
+        db.select(*[live.c[name] for name in ARCHIVED_COLUMNS], db.literal(cutoff)).where(live.c.id.in_(batch_ids))
+    ))
+    db.session.execute(live.delete().where(live.c.id.in_(batch_ids)))
+    db.session.commit()
+    return len(batch_ids)
+
+def archive_expired_shares(batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Archive shared links past their expiry; returns how many were moved"""
+    started = time.monotonic()
+    cutoff = datetime.utcnow()
+    archived = 0
+    while True:
+        count = _archive_batch(cutoff, batch_size)
+        archived += count
+        if count < batch_size:
+            break
+        time.sleep(pause)
+    
+    logger.info('Archived %d expired shared links in %.2fs', archived, time.monotonic() - started)
+    return archived
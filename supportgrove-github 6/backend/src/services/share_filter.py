@@ -0,0 +1,117 @@
+"""In-memory filter of known share IDs
+
+Each worker keeps a Bloom filter of every share ID that was ever issued,
+including archived ones. A share ID the filter has never seen is rejected
+without touching the database, which keeps random and scanned IDs away from
+``shared_conversations``.
+
+The filter is built on first use and updated as this worker creates links.
+Links created by other workers are picked up by an incremental refresh that
+reads rows past the highest ID seen so far; it runs on a miss, at most once
+per ``SHARE_FILTER_REFRESH_INTERVAL`` seconds. The archive job never removes
+the newest row, so SQLite never hands out a row ID the refresh has passed.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from src.models.story import db
+from src.models.sharing import SharedConversation, ArchivedSharedConversation
+
+REFRESH_INTERVAL = float(os.environ.get('SHARE_FILTER_REFRESH_INTERVAL', 1))
+FALSE_POSITIVE_RATE = float(os.environ.get('SHARE_FILTER_FALSE_POSITIVE_RATE', 0.01))
+MIN_CAPACITY = 10000
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+    
+    def __init__(self, capacity, false_positive_rate=FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, value):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+    
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+    
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+class ShareIdFilter:
+    """Per-worker Bloom filter of issued share IDs with incremental refresh"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._last_id = 0
+        self._refreshed_at = 0.0
+    
+    def _build(self):
+        """Load every share ID, live and archived, into a new filter"""
+        live = db.session.execute(db.select(SharedConversation.id, SharedConversation.share_id)).all()
+        archived = db.session.execute(db.select(ArchivedSharedConversation.share_id)).scalars().all()
+        bloom = BloomFilter(max(MIN_CAPACITY, 2 * (len(live) + len(archived))))
+        for _, share_id in live:
+            bloom.add(share_id)
+        for share_id in archived:
+            bloom.add(share_id)
+        self._bloom = bloom
+        self._last_id = max((row_id for row_id, _ in live), default=0)
+        self._refreshed_at = time.monotonic()
+    
+    def _refresh(self):
+        """Add share IDs created since the last build or refresh"""
+        rows = db.session.execute(
+            db.select(SharedConversation.id, SharedConversation.share_id)
+            .where(SharedConversation.id > self._last_id)
+            .order_by(SharedConversation.id.asc())
+        ).all()
+        for row_id, share_id in rows:
+            self._bloom.add(share_id)
+            self._last_id = row_id
+        self._refreshed_at = time.monotonic()
+        if self._bloom.count > self._bloom.capacity:
+            self._build()  # Grown past its capacity, so false positives would climb
+    
+    def _ensure_built(self):
+        if self._bloom is None:
+            with self._lock:
+                if self._bloom is None:
+                    self._build()
+    
+    def might_contain(self, share_id, refresh=True):
+        """Check whether a share ID may exist; False means it was never issued
+        
+        On a miss the filter first picks up links created by other workers,
+        unless it was refreshed within the last REFRESH_INTERVAL seconds.
+        """
+        self._ensure_built()
+        if share_id in self._bloom:
+            return True
+        if not refresh or time.monotonic() - self._refreshed_at < REFRESH_INTERVAL:
+            return False
+        with self._lock:
+            if time.monotonic() - self._refreshed_at >= REFRESH_INTERVAL:
+                self._refresh()
+        return share_id in self._bloom
+    
+    def add(self, *share_ids):
+        """Record share IDs created by this worker"""
+        if self._bloom is None:
+            return  # Built from the database on first use
+        with self._lock:
+            for share_id in share_ids:
+                self._bloom.add(share_id)
+
+share_id_filter = ShareIdFilter()
@@ -0,0 +1,57 @@
+import logging
+import threading
+from src.models.story import db
+from src.models.sharing import SharedConversation, StorySharingStats
+
+logger = logging.getLogger(__name__)
+
+# Views of shared links are counted in memory per worker and written as
+# additive UPDATEs by a background job, instead of a write transaction per GET.
+_lock = threading.Lock()
+_pending = {}
+
+def record_share_view(shared_conversation_id):
+    """Count one view of a shared conversation"""
+    with _lock:
+        _pending[shared_conversation_id] = _pending.get(shared_conversation_id, 0) + 1
+
+def pending_share_views(shared_conversation_id):
+    """Get the views of a shared conversation not yet written by this worker"""
+    return _pending.get(shared_conversation_id, 0)
+
+def flush_share_views():
+    """Add the buffered view counts to the database in one transaction"""
+    global _pending
+    
+    with _lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return 0
+    
+    table = SharedConversation.__table__
+    try:
+        db.session.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('shared_conversation_id'))
+            .values(view_count=db.func.coalesce(table.c.view_count, 0) + db.bindparam('views')),
+            [{'shared_conversation_id': key, 'views': views} for key, views in pending.items()]
+        )
+        # Roll the same views up into the per-story stats
+        stats = StorySharingStats.__table__
+        db.session.execute(
+            stats.update()
+            .where(stats.c.story_id == db.select(table.c.story_id).where(
+                table.c.id == db.bindparam('shared_conversation_id')
+            ).scalar_subquery())
+            .values(total_views=stats.c.total_views + db.bindparam('views')),
+            [{'shared_conversation_id': key, 'views': views} for key, views in pending.items()]
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Put the views back so the next flush retries them
+        with _lock:
+            for key, views in pending.items():
+                _pending[key] = _pending.get(key, 0) + views
+        raise
+    return sum(pending.values())
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.sqlite import insert
+from src.models.story import db, HashtagHourlyCount
+
+WINDOWS = {
+    '24h': 24,
+    '7d': 7 * 24,
+    '30d': 30 * 24
+}
+DEFAULT_WINDOW = '30d'
+MAX_TRENDING = 100
+
+# Rankings are recomputed from the hourly buckets at most this often per worker
+REFRESH_SECONDS = float(os.environ.get('TRENDING_REFRESH_SECONDS', 60))
+
+_lock = threading.Lock()
+_rankings = {}
+
+def bucket_start(moment):
+    """Truncate a timestamp to the start of its hourly bucket"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def record_hashtag_usage(hashtags, created_at, delta=1):
+    """Add a story's hashtags to the counter of the hour it was created in
+    
+    The upsert joins the caller's transaction rather than committing on its
+    own, so a story and its counters are saved or rolled back together. Call
+    ``invalidate_rankings`` once that transaction has committed.
+    """
+    if not hashtags:
+        return
+    
+    bucket = bucket_start(created_at)
+    statement = insert(HashtagHourlyCount).values([
+        {'bucket_start': bucket, 'tag': tag, 'count': delta}
+        for tag in dict.fromkeys(hashtags)
+    ])
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['bucket_start', 'tag'],
+        set_={'count': HashtagHourlyCount.count + statement.excluded.count}
+    ))
+
+def invalidate_rankings():
+    """Let this worker's next trending request see newly committed counts"""
+    with _lock:
+        _rankings.clear()
+
+def _compute_ranking(window_hours, half_life_hours):
+    """Aggregate the buckets of a window into a ranking of up to MAX_TRENDING tags"""
+    now = datetime.utcnow()
+    cutoff = bucket_start(now - timedelta(hours=window_hours - 1))
+    rows = db.session.query(
+        HashtagHourlyCount.tag,
+        HashtagHourlyCount.bucket_start,
+        HashtagHourlyCount.count
+    ).filter(HashtagHourlyCount.bucket_start >= cutoff, HashtagHourlyCount.count > 0).all()
+    
+    totals = {}
+    scores = {}
+    for tag, bucket, count in rows:
+        totals[tag] = totals.get(tag, 0) + count
+        if half_life_hours:
+            age_hours = max((now - bucket).total_seconds() / 3600, 0)
+            scores[tag] = scores.get(tag, 0) + count * 0.5 ** (age_hours / half_life_hours)
+        else:
+            scores[tag] = totals[tag]
+    
+    ranked = sorted(scores, key=lambda tag: (-scores[tag], tag))[:MAX_TRENDING]
+    return [
+        {'hashtag': tag, 'count': totals[tag], 'score': round(scores[tag], 4)}
+        for tag in ranked
+    ]
+
+def get_trending_hashtags(window=DEFAULT_WINDOW, half_life_hours=0, limit=20):
+    """Get the top hashtags for a window from the precomputed ranking
+    
+    ``half_life_hours`` applies exponential decay so that recent usage counts
+    more; 0 ranks by raw counts.
+    """
+    key = (window, round(half_life_hours, 2))
+    entry = _rankings.get(key)
+    if entry is None or time.monotonic() - entry[0] >= REFRESH_SECONDS:
+        ranking = _compute_ranking(WINDOWS[window], half_life_hours)
+        with _lock:
+            _rankings[key] = entry = (time.monotonic(), ranking)
+    return entry[1][:limit]
+
+def fill_hourly_counts(executor, cutoff):
+    """Count story_hashtags rows since ``cutoff`` into the hourly buckets
+    
+    ``executor`` is a session or connection. Also used by the migration that
+    creates the table, so both write the same bucket format.
+    """
+    # Buckets are stored in the same text format SQLAlchemy uses for DateTime
+    executor.execute(db.text("""
+        INSERT OR REPLACE INTO hashtag_hourly_counts (bucket_start, tag, count)
+        SELECT strftime('%Y-%m-%d %H:00:00.000000', story_hashtags.created_at), story_hashtags.tag, COUNT(*)
+        FROM story_hashtags JOIN story ON story.id = story_hashtags.story_id
+        WHERE story.is_approved = 1 AND story.is_flagged = 0 AND story_hashtags.created_at >= :cutoff
+        GROUP BY 1, 2
+    """), {'cutoff': cutoff})
+
+def rebuild_hashtag_counts(days=30):
+    """Recompute the hourly buckets from story_hashtags and prune old buckets
+    
+    Repairs counters for stories that were moderated or deleted after creation.
+    The delete and re-insert share one write transaction, so concurrent story
+    creation cannot slip in between them.
+    """
+    cutoff = bucket_start(datetime.utcnow() - timedelta(days=days))
+    db.session.execute(db.delete(HashtagHourlyCount))
+    fill_hourly_counts(db.session, cutoff)
+    db.session.commit()
+    invalidate_rankings()
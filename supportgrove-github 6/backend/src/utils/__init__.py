@@ -0,0 +1,2 @@
+# This file makes the utils directory a Python package
+
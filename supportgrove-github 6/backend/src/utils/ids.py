@@ -0,0 +1,8 @@
+def parse_id_list(value):
+    """Parse a comma separated list of IDs, ignoring duplicates"""
+    ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if part:
+            ids.append(int(part))
+    return list(dict.fromkeys(ids))
@@ -0,0 +1,55 @@
+import base64
+import json
+from datetime import datetime
+from src.models.story import db
+
+def encode_cursor(*values):
+    """Encode sort key values into an opaque, URL-safe cursor token"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return token.decode('ascii').rstrip('=')
+
+def decode_cursor(token, columns):
+    """Decode a cursor token back into values matching the given columns"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        raise ValueError('Invalid cursor')
+    
+    values = []
+    for column, value in zip(columns, payload):
+        if value is not None and column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        values.append(value)
+    return values
+
+def keyset_paginate(query, columns, cursor=None, limit=10, descending=True, key=None):
+    """Fetch one page of ``query`` ordered by ``columns`` using a seek cursor
+    
+    ``columns`` must end with a unique tie-breaker (usually the primary key)
+    so that every row has a distinct position. ``key`` extracts the column
+    values from a result when they are not attributes of the same name.
+    Returns ``(items, next_cursor)`` where ``next_cursor`` is None on the
+    last page.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        row = db.tuple_(*columns)
+        query = query.filter(row < db.tuple_(*values) if descending else row > db.tuple_(*values))
+    
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    items = query.order_by(*ordering).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        if key is not None:
+            next_cursor = encode_cursor(*key(last))
+        else:
+            next_cursor = encode_cursor(*[getattr(last, column.key) for column in columns])
+    return items, next_cursor
@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The app reads its configuration at import time, so point it at a throwaway database first
+_database_dir = tempfile.mkdtemp(prefix='supportgrove-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir, 'app.db')}"
+os.environ['BACKGROUND_JOBS'] = 'false'
+os.environ['RESPONSE_CACHE_BACKEND'] = 'none'
+os.environ['REACTION_WRITE_BEHIND'] = 'false'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app
+
+@pytest.fixture(scope='session')
+def app():
+    return flask_app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture(scope='session')
+def category_id(app):
+    client = app.test_client()
+    client.post('/api/categories/seed')
+    return client.get('/api/categories').get_json()['categories'][0]['id']
+
+@pytest.fixture
+def story_id(client, category_id):
+    response = client.post('/api/stories', json={
+        'title': 'A story',
+        'content': 'Something that happened',
+        'category_id': category_id,
+        'hashtags': ['hope']
+    })
+    assert response.status_code == 201
+    return response.get_json()['story']['id']
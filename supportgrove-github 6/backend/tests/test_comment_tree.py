@@ -0,0 +1,64 @@
+import itertools
+from contextlib import contextmanager
+from sqlalchemy import event
+from src.models.story import db
+from src.models.comment import Comment, CommentReaction, build_comment_tree
+
+_anonymous_ids = itertools.count()
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements sent to the database inside the block"""
+    statements = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+def add_thread(story_id, depth, width):
+    """Add ``width`` top-level comments, each with a chain of replies ``depth`` deep
+    
+    Every comment gets a reaction so the tree has counts to load as well.
+    """
+    for _ in range(width):
+        parent_id = None
+        for _ in range(depth):
+            comment = Comment(
+                story_id=story_id,
+                parent_comment_id=parent_id,
+                content='A comment',
+                anonymous_id=f'user-{next(_anonymous_ids)}'
+            )
+            db.session.add(comment)
+            db.session.flush()
+            db.session.add(CommentReaction(comment_id=comment.id, reaction_type='hug', anonymous_id='reader'))
+            parent_id = comment.id
+    db.session.commit()
+
+def tree_depth(comments):
+    return 1 + max((tree_depth(comment['replies']) for comment in comments), default=0) if comments else 0
+
+def build_and_count(story_id):
+    db.session.expire_all()  # Nothing may come from the identity map
+    with count_queries() as statements:
+        tree = build_comment_tree(story_id)
+    return tree, len(statements)
+
+def test_comment_tree_query_count_does_not_grow_with_thread_size(app, story_id):
+    with app.app_context():
+        add_thread(story_id, depth=2, width=2)
+        small_tree, small_count = build_and_count(story_id)
+        assert tree_depth(small_tree) == 2
+        
+        add_thread(story_id, depth=8, width=10)
+        large_tree, large_count = build_and_count(story_id)
+        assert len(large_tree) == 12
+        assert tree_depth(large_tree) == 8
+        assert large_tree[-1]['reaction_counts']['hug'] == 1
+        
+        assert small_count == large_count == 2
@@ -0,0 +1,54 @@
+import random
+import threading
+from src.models.story import db, Story, Reaction, Response
+
+THREADS = 8
+REQUESTS_PER_THREAD = 40
+REACTION_TYPES = ['heart', 'hug', 'strength']
+COUNTERS = ['heart_count', 'hug_count', 'strength_count', 'response_count']
+
+def hammer(app, story_id, seed, observed, errors):
+    """Randomly add and remove reactions and post responses against one story"""
+    client = app.test_client()
+    rng = random.Random(seed)
+    for _ in range(REQUESTS_PER_THREAD):
+        # A few shared users, so adds and removes of the same reaction race each other
+        body = {'anonymous_id': f'user-{rng.randrange(3)}', 'reaction_type': rng.choice(REACTION_TYPES)}
+        action = rng.random()
+        if action < 0.45:
+            response = client.post(f'/api/stories/{story_id}/reactions', json=body)
+        elif action < 0.9:
+            response = client.delete(f'/api/stories/{story_id}/reactions', json=body)
+        else:
+            response = client.post(f'/api/stories/{story_id}/responses', json={'content': 'Sending support'})
+        
+        data = response.get_json()
+        if response.status_code >= 500:
+            errors.append(data.get('error'))
+        if 'counts' in data:
+            observed.append(data['counts'])
+
+def test_counters_match_rows_under_concurrent_writes(app, story_id):
+    observed = []
+    errors = []
+    threads = [
+        threading.Thread(target=hammer, args=(app, story_id, seed, observed, errors))
+        for seed in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert not errors
+    assert observed
+    for counts in observed:
+        assert all(value >= 0 for value in counts.values()), counts
+    
+    with app.app_context():
+        story = db.session.get(Story, story_id)
+        for reaction_type, counter in Story.REACTION_COUNTERS.items():
+            rows = Reaction.query.filter_by(story_id=story_id, reaction_type=reaction_type).count()
+            assert getattr(story, counter) == rows, counter
+        assert story.response_count == Response.query.filter_by(story_id=story_id).count()
+        assert all(getattr(story, counter) >= 0 for counter in COUNTERS)
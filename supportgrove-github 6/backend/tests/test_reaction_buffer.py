@@ -0,0 +1,119 @@
+import threading
+import pytest
+from src.models.story import db, Story, Reaction
+from src.services.reaction_buffer import reaction_buffer, ReactionBuffer
+
+HEART = {'anonymous_id': 'reader', 'reaction_type': 'heart'}
+
+@pytest.fixture
+def buffer(monkeypatch, tmp_path):
+    """Turn the write-behind buffer on with an empty journal directory"""
+    fresh = ReactionBuffer()
+    for name in ('_pending', '_deltas', '_in_flight', '_journal', '_journal_path'):
+        monkeypatch.setattr(reaction_buffer, name, getattr(fresh, name))
+    monkeypatch.setattr(reaction_buffer, 'enabled', True)
+    monkeypatch.setattr(reaction_buffer, 'journal_dir', str(tmp_path))
+    yield reaction_buffer
+    if reaction_buffer._journal is not None:
+        reaction_buffer._journal.close()
+
+@pytest.fixture
+def pause_flush(monkeypatch):
+    """Hold every journal replay until ``resume`` is set"""
+    started, resume = threading.Event(), threading.Event()
+    apply_journal = reaction_buffer._apply_journal
+    
+    def paused(path):
+        started.set()
+        assert resume.wait(10)
+        return apply_journal(path)
+    
+    monkeypatch.setattr(reaction_buffer, '_apply_journal', paused)
+    return started, resume
+
+def flush_in_background(app):
+    def run():
+        with app.app_context():
+            reaction_buffer.flush()
+    
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+def flush(app):
+    with app.app_context():
+        return reaction_buffer.flush()
+
+def stored_hearts(app, story_id):
+    with app.app_context():
+        rows = Reaction.query.filter_by(story_id=story_id, reaction_type='heart').count()
+        return db.session.get(Story, story_id).heart_count, rows
+
+def test_ops_stay_visible_while_their_flush_is_in_progress(app, client, story_id, buffer, pause_flush):
+    started, resume = pause_flush
+    assert client.post(f'/api/stories/{story_id}/reactions', json=HEART).status_code == 200
+    
+    flusher = flush_in_background(app)
+    assert started.wait(10)
+    try:
+        # The add is neither pending nor committed at this point
+        repeated = client.post(f'/api/stories/{story_id}/reactions', json=HEART)
+        assert repeated.status_code == 400
+        
+        removed = client.delete(f'/api/stories/{story_id}/reactions', json=HEART)
+        assert removed.status_code == 200
+        assert removed.get_json()['counts']['heart_count'] == 0
+        
+        added = client.post(f'/api/stories/{story_id}/reactions', json=HEART)
+        assert added.status_code == 200
+        assert added.get_json()['counts']['heart_count'] == 1
+    finally:
+        resume.set()
+        flusher.join()
+    
+    assert stored_hearts(app, story_id) == (1, 1)
+    flush(app)
+    assert stored_hearts(app, story_id) == (1, 1)
+    assert buffer.pending_deltas('story', story_id) == {}
+
+def test_comment_toggle_sees_a_flush_in_progress(app, client, story_id, buffer, pause_flush):
+    started, resume = pause_flush
+    comment = client.post(f'/api/stories/{story_id}/comments', json={'content': 'Thank you'})
+    comment_id = comment.get_json()['comment']['id']
+    toggle = {'reaction_type': 'hug'}
+    headers = {'X-Anonymous-ID': 'reader'}
+    
+    first = client.post(f'/api/comments/{comment_id}/reactions', json=toggle, headers=headers)
+    assert first.get_json()['action'] == 'added'
+    
+    flusher = flush_in_background(app)
+    assert started.wait(10)
+    try:
+        second = client.post(f'/api/comments/{comment_id}/reactions', json=toggle, headers=headers)
+        assert second.get_json()['action'] == 'removed'
+        assert second.get_json()['reaction_counts']['hug'] == 0
+    finally:
+        resume.set()
+        flusher.join()
+    
+    flush(app)
+    counts = client.get(f'/api/stories/{story_id}/comments').get_json()['comments'][0]['reaction_counts']
+    assert counts['hug'] == 0
+
+def test_failed_flush_keeps_ops_for_the_retry(app, client, story_id, buffer, monkeypatch):
+    assert client.post(f'/api/stories/{story_id}/reactions', json=HEART).status_code == 200
+    
+    apply_journal = reaction_buffer._apply_journal
+    
+    def failing(path):
+        raise RuntimeError('database is locked')
+    
+    monkeypatch.setattr(reaction_buffer, '_apply_journal', failing)
+    assert flush(app) == 0
+    assert buffer.pending_deltas('story', story_id) == {'heart': 1}
+    assert client.post(f'/api/stories/{story_id}/reactions', json=HEART).status_code == 400
+    
+    monkeypatch.setattr(reaction_buffer, '_apply_journal', apply_journal)
+    assert flush(app) == 1
+    assert stored_hearts(app, story_id) == (1, 1)
+    assert buffer.pending_deltas('story', story_id) == {}
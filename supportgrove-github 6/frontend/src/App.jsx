@@ -59,9 +59,44 @@ function App() {
   useEffect(() => {
     fetchData()
     fetchNotifications()
-    // Poll for new notifications every 30 seconds
-    const interval = setInterval(fetchNotifications, 30000)
-    return () => clearInterval(interval)
+
+    // Poll for new notifications every 30 seconds when streaming is unavailable
+    let interval = null
+    const startPolling = () => {
+      if (!interval) {
+        interval = setInterval(fetchNotifications, 30000)
+      }
+    }
+
+    if (typeof EventSource === 'undefined') {
+      startPolling()
+      return () => clearInterval(interval)
+    }
+
+    // Live notifications over Server-Sent Events; the browser reconnects and resumes on its own
+    const source = new EventSource(`${API_BASE}/notifications/stream?anonymous_id=${encodeURIComponent(anonymousId)}`)
+    const updateUnreadCount = (event) => setUnreadCount(JSON.parse(event.data).unread_count)
+
+    source.addEventListener('notification', (event) => {
+      const data = JSON.parse(event.data)
+      setNotifications(prev => [data.notification, ...prev.filter(n => n.id !== data.notification.id)])
+      setUnreadCount(data.unread_count)
+    })
+    source.addEventListener('unread_count', updateUnreadCount)
+    source.addEventListener('read', updateUnreadCount)
+    source.addEventListener('deleted', updateUnreadCount)
+    source.addEventListener('resync', fetchNotifications)
+    source.onerror = () => {
+      // The stream was refused (e.g. the server is at capacity), so fall back to polling
+      if (source.readyState === EventSource.CLOSED) {
+        startPolling()
+      }
+    }
+
+    return () => {
+      source.close()
+      clearInterval(interval)
+    }
   }, [])
 
   const fetchData = async () => {